@@ -1,11 +1,13 @@
 from . import log
 from .app import Volt
-from .http import Request, Response, Header, Handler
+from .http import Request, Response, StreamingResponse, Header, Headers, Handler
 
 __all__ = [
     "Volt",
     "Request",
     "Response",
+    "StreamingResponse",
     "Header",
+    "Headers",
     "Handler",
 ]
@@ -3,14 +3,11 @@ from collections.abc import Coroutine
 from contextlib import _AsyncGeneratorContextManager, asynccontextmanager
 import logging
 from http import HTTPMethod, HTTPStatus
-from http import cookies as http_cookies
-import mimetypes
 from pathlib import Path
 import traceback
 from typing import Any, Callable
-from urllib.parse import parse_qs
 
-from volt import asgi, middleware, http, trie
+from volt import asgi, config, middleware, http, static, trie
 
 log = logging.getLogger("volt")
 
@@ -25,26 +22,40 @@ async def default_lifespan(app: "Volt"):
 type LifespanContextManager = Callable[["Volt"], _AsyncGeneratorContextManager[None, None]]
 Handler = Callable[
     [asgi.HTTPScope, asgi.ASGIReceiveCallable, asgi.ASGISendCallable, trie.RouteParams],
-    Coroutine[Any, Any, http.Response],
+    Coroutine[Any, Any, http.Response | None],
 ]
 
 
 class Volt:
     routes: trie.Node[Handler]
+    # Routes flattened for matching. Compiled when the app is frozen, or lazily on the first request after a route
+    # is registered
+    compiled_routes: trie.CompiledRoutes[Handler] | None
     middlewares: list[middleware.MiddlewareType]
+    # Each registered handler, mapped to its handler wrapped in the full middleware stack. Rebuilt whenever
+    # middleware is registered, or when the app is frozen, so that requests don't rebuild the stack every time
+    middleware_stacks: dict[http.Handler, http.Handler]
     lifespan: LifespanContextManager
     _started: bool = False
-    static_path: str = "/static"
+    static_path: str = config.static_url_path
     static_location: str | None
+    static_files: static.StaticFileCache
 
     def __init__(self, static_location: str | None = None, lifespan: LifespanContextManager | None = None) -> None:
         self.routes = trie.Node[Handler]()
+        self.compiled_routes = None
         self.middlewares = [middleware.htmx]
+        self.middleware_stacks = {}
         self.lifespan = lifespan if lifespan is not None else default_lifespan
-        if static_location is not None:
-            if not Path(static_location).exists():
-                raise RuntimeError(f"static directory: {static_location} could not be found at {Path().resolve()}")
-            self.static_location = static_location
+        if static_location is None:
+            # The same directory the 'static' template global links into
+            static_location = config.static_location
+        elif not Path(static_location).exists():
+            raise RuntimeError(f"static directory: {static_location} could not be found at {Path().resolve()}")
+        self.static_location = static_location
+        self.static_files = static.StaticFileCache(
+            frozen=config.static_cache_frozen, max_file_size=config.static_cache_max_file_size
+        )
 
     async def __call__(self, scope: asgi.Scope, receive: asgi.ASGIReceiveCallable, send: asgi.ASGISendCallable) -> None:
         if scope["type"] == "lifespan":
@@ -57,39 +68,43 @@ class Volt:
 
         assert scope["type"] == "http"
 
-        if scope["path"].startswith("/static"):
+        if scope["path"].startswith(self.static_path + "/"):
             return await self.handle_static_route(scope, receive, send)
 
-        matched_route = trie.get(self.routes, scope["path"], HTTPMethod(scope["method"]))
+        if self.compiled_routes is None:
+            self.compiled_routes = trie.compile_routes(self.routes)
+
+        matched_route = self.compiled_routes.get(scope["path"], HTTPMethod(scope["method"]))
         if matched_route is None:
             await http.generic_response(send, HTTPStatus.NOT_FOUND)
             return
 
         response = await matched_route.handler(scope, receive, send, matched_route.route_params)
+        if response is None:
+            log.debug("client disconnected before a response was sent")
+            return
 
-        response.headers.insert(0, http.Header("content-type", response.content_type))
-
-        if response.cookies is not None:
-            for cookie in response.cookies.items():
-                response.headers.append(http.Header("Set-Cookie", cookie[1].OutputString()))
-
-        start_event: asgi.HTTPResponseStartEvent = {
-            "type": "http.response.start",
-            "status": response.status,
-            "headers": [(header.name.encode(), header.value.encode()) for header in response.headers],
-        }
-
-        await send(start_event)
-        response_body: asgi.HTTPResponseBodyEvent = {
-            "type": "http.response.body",
-            "body": response.body.encode(),
-        }
-        await send(response_body)
+        await response.respond(receive, send)
 
         log.debug("finished")
 
     def middleware(self, middleware_fn: middleware.MiddlewareType):
         self.middlewares.append(middleware_fn)
+        self.build_middleware_stacks()
+
+    def build_middleware_stacks(self) -> None:
+        """(Re)compose the middleware stack for every registered handler"""
+        for handler in self.middleware_stacks:
+            self.middleware_stacks[handler] = middleware.create_middleware_stack(handler, *self.middlewares)
+
+    def freeze(self) -> None:
+        """
+        Prepare the app for serving requests. Called on lifespan startup, once all routes and middleware
+        have been registered.
+        """
+        self.build_middleware_stacks()
+        self.compiled_routes = trie.compile_routes(self.routes)
+        self._started = True
 
     def route(self, path: str, method: str):
         """Register a route handler on 'path'"""
@@ -100,140 +115,79 @@ class Volt:
                 receive: asgi.ASGIReceiveCallable,
                 send: asgi.ASGISendCallable,
                 route_params: trie.RouteParams,
-            ) -> http.Response:
+            ) -> http.Response | None:
                 _ = send  # Keeping this around for now
-                log.debug("registering handler")
-
-                query_string = scope["query_string"]
-                query_params = parse_qs(query_string.decode())
-
-                request_headers: list[http.Header] = []
-                for header_key, header_value in scope["headers"]:
-                    request_headers.append(http.Header(header_key.decode(), header_value.decode()))
-
-                request_event = await receive()
-                match request_event["type"]:
-                    case "http.request":
-                        request_body = request_event["body"].decode()
-                    case _:
-                        raise Exception(f"Unexpected event: {request_event}")
-
-                log.debug(f"request body: {request_body}")
-
-                request_cookies = http_cookies.SimpleCookie()
-                form_data: dict[str, list[str]] = {}
-                # TODO: Don't need to iterate through headers a second time. Move this to above
-                for header in request_headers:
-                    if header.name.lower() == "cookie":
-                        request_cookies.load(header.value)
-                    if header.name.lower() == "content-type" and header.value == "application/x-www-form-urlencoded":
-                        form_data = parse_qs(request_body)
-                        log.debug(f"parsed form data: {form_data}")
+
+                request_object = http.Request(scope, receive, route_params)
+
+                # Reject bodies we know are too large up front, before the handler (or client) does any more work
+                content_length = request_object.headers.get("content-length")
+                if content_length is not None:
+                    # isdigit alone accepts digits int() doesn't, like '²'
+                    if not (content_length.isascii() and content_length.isdigit()):
+                        return http.status_response(HTTPStatus.BAD_REQUEST)
+                    if int(content_length) > config.max_body_size:
+                        return http.status_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
 
                 try:
-                    method = HTTPMethod(scope["method"])
-                except ValueError as e:
-                    log.error("unexpected HTTP method")
-                    raise e
-
-                request_object = http.Request(
-                    method=method,
-                    path=scope["path"],
-                    body=request_body,
-                    form_data=form_data,
-                    headers=request_headers,
-                    cookies=request_cookies,
-                    query_params=query_params,
-                    route_params=route_params,
-                )
-
-                handler_with_middleware = middleware.create_middleware_stack(handler, *self.middlewares)
-                handler_response = await handler_with_middleware(request_object)
-
-                return handler_response
+                    return await self.middleware_stacks[handler](request_object)
+                except http.PayloadTooLargeError:
+                    return http.status_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+                except http.ClientDisconnectError:
+                    # Nobody is left to send a response to
+                    return None
 
             trie.insert(self.routes, path, HTTPMethod(method), request_handler)
+            self.compiled_routes = None
+            self.middleware_stacks[handler] = middleware.create_middleware_stack(handler, *self.middlewares)
 
         return decorator
 
     async def handle_static_route(
         self, scope: asgi.HTTPScope, receive: asgi.ASGIReceiveCallable, send: asgi.ASGISendCallable
     ) -> None:
+        if self.static_location is None:
+            log.debug("no static location configured")
+            return await http.generic_response(send, HTTPStatus.NOT_FOUND)
+
         path = scope["path"]
         if ".." in path:
             log.debug("path %s cannot contain '..'", path)
             return await http.generic_response(send, HTTPStatus.FORBIDDEN)
 
         # Prevent a URL like something.io/static/////
-        while path.startswith("/"):
-            path = path[1:]
+        name = path.removeprefix(self.static_path).lstrip("/")
 
-        # filename, plus '.', plus extension _should_ be at least 3 chars. I.e. static/c.h
-        if len(path) < 3:
+        # filename, plus '.', plus extension _should_ be at least 3 chars. I.e. c.h
+        if len(name) < 3:
             log.debug("path %s is too short", path)
             return await http.generic_response(send, HTTPStatus.NOT_FOUND)
 
-        file_path = Path(path.replace("static", self.static_location))
-        if not file_path.exists():
-            log.debug("path %s does not exist", file_path.resolve())
+        file_path = Path(self.static_location) / name
+        static_file = await self.static_files.get(file_path)
+        if static_file is None:
             return await http.generic_response(send, HTTPStatus.NOT_FOUND)
 
-        log.debug("reading file %s", file_path.resolve())
-        if not file_path.is_file():
-            log.debug("path %s is not a file", path)
-            return await http.generic_response(send, HTTPStatus.NOT_FOUND)
-
-        file_size = file_path.stat().st_size
-        content_type, content_encoding = mimetypes.guess_file_type(path)
-
-        # TODO: Check this
-        if content_type is None:
-            content_type = "application/octet-stream"
-
-        headers = [
-            (b"content-type", content_type.encode()),
-            (b"content-length", str(file_size).encode()),
-        ]
-
-        if content_encoding is not None:
-            headers.append((b"content-encoding", content_encoding.encode()))
-
-        log.debug("starting read...")
-        log.debug("headers %s", headers)
-        start_response: asgi.HTTPResponseStartEvent = {
-            "type": "http.response.start",
-            "status": HTTPStatus.OK,
-            "headers": headers,
-        }
-        await send(start_response)
-
-        chunk_size = 64 * 1024  # 64KB Chunk size
-
-        f = await asyncio.to_thread(open, file_path, "rb")
-        try:
-            while True:
-                log.debug("reading chunk...")
-                chunk = await asyncio.to_thread(f.read, chunk_size)
-                if not chunk:
-                    break
-
-                log.debug("chunk read.")
-                response_body: asgi.HTTPResponseBodyEvent = {
-                    "type": "http.response.body",
-                    "body": chunk,
-                    "more_body": True,
-                }
-                await send(response_body)
-                log.debug("chunk sent.")
-        finally:
-            await asyncio.to_thread(f.close)
-
-        final_response_body: asgi.HTTPResponseBodyEvent = {
-            "type": "http.response.body",
-            "body": b"",
-            "more_body": False,
-        }
-        await send(final_response_body)
+        request_headers = http.Headers.from_raw(scope["headers"])
+        precompressed = await self.static_files.get_precompressed(static_file)
+        if precompressed:
+            encoding = http.negotiate_encoding(request_headers.get("accept-encoding"), list(precompressed))
+            if encoding is not None:
+                static_file = precompressed[encoding]
+
+        # Fingerprinted copies written by collectstatic can be cached forever, as any change gets a new name
+        manifest = static.get_manifest(Path(self.static_location), frozen=self.static_files.frozen)
+        immutable = manifest.is_fingerprinted(name)
+
+        log.debug("serving file %s", static_file.path)
+        await static.send_file(
+            static_file,
+            request_headers,
+            send,
+            scope.get("extensions"),
+            vary=bool(precompressed),
+            immutable=immutable,
+        )
 
     async def handle_lifespan(
         self, scope: asgi.LifespanScope, receive: asgi.ASGIReceiveCallable, send: asgi.ASGISendCallable
@@ -242,6 +196,12 @@ class Volt:
         message = await receive()
         assert message["type"] == "lifespan.startup"
         try:
+            self.freeze()
+            if config.template_warm_on_startup:
+                # Imported here, so importing volt doesn't set up the template environment
+                from volt import components
+
+                _ = await asyncio.to_thread(components.warm_templates)
             async with self.lifespan(self):
                 await send({"type": "lifespan.startup.complete"})
                 started = True
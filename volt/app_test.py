@@ -1,17 +1,22 @@
-from collections.abc import Generator
-from contextlib import asynccontextmanager
+import asyncio
+import gzip
 import logging
-from pathlib import Path
 import shutil
+import subprocess
+import sys
 import threading
-from http import HTTPStatus, cookies as HTTPCookies
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from http import cookies as HTTPCookies
+from pathlib import Path
 
 import pytest
 import requests
 import uvicorn
 
-from volt import Volt, http
-
+from volt import Volt, asgi, config, http, static
+from volt.testing import make_request, make_scope
 
 log = logging.getLogger("volt.py")
 app = Volt()
@@ -95,7 +100,8 @@ def test_forbidden():
 
 @app.route("/post", method="POST")
 async def post(request: http.Request) -> http.Response:
-    assert request.form_data.get("foo") == ["bar"]
+    form_data = await request.form()
+    assert form_data.get("foo") == ["bar"]
     return http.Response("post data success", status=HTTPStatus.CREATED)
 
 
@@ -298,6 +304,186 @@ def test_out_of_order():
     assert response.status_code == HTTPStatus.OK
 
 
+@app.route("/body", method="POST")
+async def body(request: http.Request) -> http.Response:
+    body = await request.body()
+    # Buffered bodies can be read again
+    assert await request.body() == body
+    return http.Response(f"received {len(body)} bytes")
+
+
+@app.route("/json", method="POST")
+async def json_body(request: http.Request) -> http.Response:
+    data = await request.json()
+    return http.Response(f"hello {data['name']}")
+
+
+@app.route("/stream", method="POST")
+async def stream(request: http.Request) -> http.Response:
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+    return http.Response(f"received {received} bytes")
+
+
+def test_request_body():
+    response = requests.post("http://localhost:1235/body", data=b"x" * 1000)
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"received 1000 bytes"
+
+    response = requests.post("http://localhost:1235/json", json={"name": "volt"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"hello volt"
+
+
+def test_request_body_chunked():
+    def chunks() -> Generator[bytes]:
+        for _ in range(10):
+            yield b"x" * 100
+
+    # A generator body is sent with chunked transfer encoding, so arrives across several events
+    response = requests.post("http://localhost:1235/body", data=chunks())
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"received 1000 bytes"
+
+    response = requests.post("http://localhost:1235/stream", data=chunks())
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"received 1000 bytes"
+
+
+def test_request_body_too_large():
+    too_large = b"x" * (config.max_body_size + 1)
+
+    # Rejected up front from the content-length header
+    response = requests.post("http://localhost:1235/body", data=too_large)
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+    # Rejected while streaming, when there is no content-length
+    def chunks() -> Generator[bytes]:
+        for i in range(0, len(too_large), 64 * 1024):
+            yield too_large[i : i + 64 * 1024]
+
+    response = requests.post("http://localhost:1235/stream", data=chunks())
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_request_body_malformed_content_length():
+    sent: list[asgi.ASGISendEvent] = []
+
+    async def receive() -> asgi.ASGIReceiveEvent:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(event: asgi.ASGISendEvent) -> None:
+        sent.append(event)
+
+    for content_length in (b"abc", "\u00b2".encode(), b"-1"):
+        scope = make_scope("/body", headers=[(b"content-length", content_length)], method="POST")
+        sent.clear()
+        asyncio.run(app(scope, receive, send))
+        assert sent[0]["type"] == "http.response.start"
+        assert sent[0]["status"] == HTTPStatus.BAD_REQUEST, content_length
+
+
+def test_request_body_disconnect():
+    sent: list[asgi.ASGISendEvent] = []
+
+    scope = make_scope("/body", method="POST")
+
+    async def receive() -> asgi.ASGIReceiveEvent:
+        return {"type": "http.disconnect"}
+
+    async def send(event: asgi.ASGISendEvent) -> None:
+        sent.append(event)
+
+    # The client went away mid-body, so there is nobody to send a response to
+    asyncio.run(app(scope, receive, send))
+    assert sent == []
+
+
+@app.route("/streaming", method="GET")
+async def streaming(_request: http.Request) -> http.Response:
+    async def rows() -> AsyncGenerator[str]:
+        yield "id,name\n"
+        for i in range(3):
+            yield f"{i},row {i}\n"
+
+    return http.StreamingResponse(rows(), content_type="text/csv")
+
+
+@app.route("/streaming-sync", method="GET")
+async def streaming_sync(_request: http.Request) -> http.Response:
+    return http.StreamingResponse([b"sync ", "chunks"], content_type="text/plain")
+
+
+def test_streaming_response():
+    response = requests.get("http://localhost:1235/streaming", stream=True)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("content-type") == "text/csv"
+    assert response.headers.get("transfer-encoding") == "chunked"
+    assert response.content == b"id,name\n0,row 0\n1,row 1\n2,row 2\n"
+
+    response = requests.get("http://localhost:1235/streaming-sync")
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"sync chunks"
+
+
+def test_streaming_response_disconnect():
+    closed = asyncio.Event()
+    sent: list[asgi.ASGISendEvent] = []
+
+    async def rows() -> AsyncGenerator[str]:
+        try:
+            while True:
+                yield "row\n"
+                await asyncio.sleep(0)
+        finally:
+            closed.set()
+
+    async def receive() -> asgi.ASGIReceiveEvent:
+        # Disconnect once a few chunks have been sent
+        while len(sent) < 4:
+            await asyncio.sleep(0)
+        return {"type": "http.disconnect"}
+
+    async def send(event: asgi.ASGISendEvent) -> None:
+        sent.append(event)
+
+    async def run() -> None:
+        await asyncio.wait_for(http.StreamingResponse(rows()).respond(receive, send), timeout=2)
+
+    asyncio.run(run())
+
+    assert closed.is_set()
+    assert sent[0]["type"] == "http.response.start"
+    assert all(event.get("more_body") for event in sent[1:])
+
+
+@app.route("/bytes", method="GET")
+async def bytes_body(_request: http.Request) -> http.Response:
+    return http.Response(b"<p>pre-rendered</p>")
+
+
+@app.route("/memoryview", method="GET")
+async def memoryview_body(_request: http.Request) -> http.Response:
+    return http.Response(memoryview(bytearray("<p>ünïcode</p>".encode())), content_type="text/plain")
+
+
+def test_bytes_response():
+    response = requests.get("http://localhost:1235/bytes")
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"<p>pre-rendered</p>"
+    assert response.headers.get("content-length") == "19"
+
+    response = requests.get("http://localhost:1235/memoryview")
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == "<p>ünïcode</p>".encode()
+    assert response.headers.get("content-length") == "16"
+    assert response.headers.get("content-type") == "text/plain"
+
+    response = requests.get("http://localhost:1235/success")
+    assert response.headers.get("content-length") == "7"
+
+
 @pytest.fixture(scope="function")
 def styles_css_file() -> Generator[None]:
     """Create a static styles.css file for the duration of the test"""
@@ -316,6 +502,8 @@ a {
     _ = styles_file.write_text(css_content, encoding="utf-8")
 
     app.static_location = "volt/static"
+    # Each test writes its own manifest, so don't keep one loaded by an earlier test
+    static._manifests.clear()
 
     yield
 
@@ -335,6 +523,74 @@ def test_static(styles_css_file: None):
     assert response.headers.get("content-type") == "text/css"
     assert response.headers.get("content-length") == "89"
 
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    assert etag is not None
+    assert last_modified is not None
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers.get("etag") == etag
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("content-length") == "89"
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("content-encoding") is None
+    assert response.headers.get("vary") is None
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"Range": "bytes=1-3"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.headers.get("content-range") == "bytes 1-3/89"
+    assert response.content == b"a {"
+
+
+def test_static_precompressed(styles_css_file: None):
+    _ = styles_css_file
+
+    styles_file = Path(__file__).parent / "static" / "styles.css"
+    compressed = gzip.compress(styles_file.read_bytes())
+    _ = styles_file.with_name("styles.css.gz").write_bytes(compressed)
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("content-type") == "text/css"
+    assert response.headers.get("content-encoding") == "gzip"
+    assert response.headers.get("content-length") == str(len(compressed))
+    assert response.headers.get("vary") == "accept-encoding"
+    assert response.content == styles_file.read_bytes()
+
+    response = requests.get("http://localhost:1235/static/styles.css", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("content-encoding") is None
+    assert response.headers.get("content-length") == "89"
+    assert response.headers.get("vary") == "accept-encoding"
+
+
+def test_static_fingerprinted(styles_css_file: None):
+    _ = styles_css_file
+
+    manifest = static.collect_static(Path(__file__).parent / "static")
+
+    response = requests.get(f"http://localhost:1235/static/{manifest['styles.css']}")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("cache-control") == "public, max-age=31536000, immutable"
+
+    response = requests.get("http://localhost:1235/static/styles.css")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers.get("cache-control") is None
+
+
+def test_import_is_lazy():
+    # Importing volt, or its CLI, shouldn't set up the template environment or its bytecode cache
+    code = "import sys, volt, volt.cli; assert 'volt.components' not in sys.modules"
+    assert subprocess.run([sys.executable, "-c", code], check=False).returncode == 0
+
 
 def test_lifespan():
     started = threading.Event()
@@ -370,3 +626,39 @@ def test_lifespan():
     thread.join(timeout=5)
 
     assert not lifespan_run.is_set()
+
+
+def test_middleware_stack_rebuilt_on_registration():
+    middleware_app = Volt()
+    calls: list[str] = []
+
+    async def handler(_request: http.Request) -> http.Response:
+        calls.append("handler")
+        return http.Response("middleware")
+
+    middleware_app.route("/middleware", method="GET")(handler)
+    stack = middleware_app.middleware_stacks[handler]
+
+    # Freezing the app, or registering new middleware, recomposes the stack
+    middleware_app.freeze()
+    assert middleware_app.middleware_stacks[handler] is not stack
+    stack = middleware_app.middleware_stacks[handler]
+
+    @middleware_app.middleware
+    async def record(request: http.Request, handler: http.Handler) -> http.Response:
+        calls.append("middleware")
+        return await handler(request)
+
+    assert middleware_app.middleware_stacks[handler] is not stack
+
+    request = make_request("/middleware", headers=[(b"cookie", b"flavour=choc-chip")])
+    response = asyncio.run(middleware_app.middleware_stacks[handler](request))
+    assert response.body == "middleware"
+    assert calls == ["middleware", "handler"]
+
+    # Attributes the handler never read are never decoded
+    assert "cookies" not in vars(request)
+    cookie = request.cookies.get("flavour")
+    assert cookie is not None
+    assert cookie.value == "choc-chip"
+    assert "cookies" in vars(request)
@@ -33,7 +33,7 @@ from __future__ import annotations
 import sys
 import types
 from collections.abc import Awaitable, Iterable, MutableMapping
-from typing import Any, Callable, Literal, Optional, Protocol, TypedDict, Union
+from typing import Any, BinaryIO, Callable, Literal, Optional, Protocol, TypedDict, Union
 
 if sys.version_info >= (3, 11):  # pragma: py-lt-311
     from typing import NotRequired
@@ -121,6 +121,19 @@ class HTTPResponseBodyEvent(TypedDict):
     more_body: NotRequired[bool]
 
 
+class HTTPResponseZeroCopyEvent(TypedDict):
+    type: Literal["http.response.zerocopy"]
+    file: BinaryIO
+    offset: NotRequired[int]
+    count: NotRequired[int]
+    more_body: NotRequired[bool]
+
+
+class HTTPResponsePathsendEvent(TypedDict):
+    type: Literal["http.response.pathsend"]
+    path: str
+
+
 class HTTPResponseTrailersEvent(TypedDict):
     type: Literal["http.response.trailers"]
     headers: Iterable[tuple[bytes, bytes]]
@@ -244,6 +257,8 @@ ASGIReceiveEvent = Union[
 ASGISendEvent = Union[
     HTTPResponseStartEvent,
     HTTPResponseBodyEvent,
+    HTTPResponseZeroCopyEvent,
+    HTTPResponsePathsendEvent,
     HTTPResponseTrailersEvent,
     HTTPServerPushEvent,
     HTTPDisconnectEvent,
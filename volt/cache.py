@@ -0,0 +1,229 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from functools import wraps
+from http import HTTPMethod, HTTPStatus
+from typing import Any, NamedTuple, final
+
+from volt import http
+
+log = logging.getLogger("volt.cache.py")
+
+
+class CacheKey(NamedTuple):
+    method: HTTPMethod
+    path: str
+    query_params: tuple[tuple[str, tuple[str, ...]], ...]
+    hx_request: bool
+    hx_fragment: str | None
+
+
+@final
+class CachedResponse:
+    __slots__ = ("body", "content_type", "expires_at", "headers", "size", "status", "tags")
+
+    def __init__(
+        self,
+        body: bytes,
+        content_type: str,
+        status: HTTPStatus,
+        headers: list[http.Header],
+        expires_at: float | None,
+        tags: frozenset[str],
+    ) -> None:
+        self.body = body
+        self.content_type = content_type
+        self.status = status
+        self.headers = headers
+        self.expires_at = expires_at
+        self.tags = tags
+        self.size = len(body) + sum(len(header.name) + len(header.value) for header in headers)
+
+
+type Tags = Iterable[str] | Callable[[http.Request], Iterable[str]]
+
+
+class ResponseCache:
+    """
+    An in memory cache of encoded responses. Handlers are opted in with the 'cached' decorator, after which a cache
+    hit returns the stored bytes and headers without calling the handler at all, skipping any template rendering
+    and encoding.
+
+    Responses are keyed on the method, path, the query params named by the decorator, and the HTMX request and
+    fragment, so full pages and partials are cached separately. Only 200 responses without cookies are cached, and
+    never streamed responses. Entries expire after their TTL, can be invalidated by tag, and are evicted least
+    recently used first once the cache holds more than 'max_entries' responses, or 'max_bytes' of bodies and headers.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float | None = 60) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self._tagged: dict[str, set[CacheKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cached(
+        self, ttl: float | None = None, query_params: Iterable[str] = (), tags: Tags = ()
+    ) -> Callable[[http.Handler], http.Handler]:
+        """
+        Cache the responses of the decorated handler. 'ttl' overrides the cache's default TTL, in seconds.
+        'query_params' names the query params that change the response, any others are ignored. 'tags' are used
+        to invalidate entries, and can be given per request as a function of the request.
+        """
+        query_param_names = tuple(sorted(query_params))
+        entry_ttl = ttl if ttl is not None else self.ttl
+
+        def decorator(handler: http.Handler) -> http.Handler:
+            @wraps(handler)
+            async def cached_handler(request: http.Request) -> http.Response:
+                key = CacheKey(
+                    request.method,
+                    request.path,
+                    tuple((name, tuple(request.query_params.get(name, ()))) for name in query_param_names),
+                    request.hx_request,
+                    request.hx_fragment,
+                )
+
+                entry = self.get(key)
+                if entry is not None:
+                    log.debug("cache hit: %s", key)
+                    return http.Response(entry.body, entry.content_type, entry.status, entry.headers)
+
+                log.debug("cache miss: %s", key)
+                response = await handler(request)
+                if (
+                    response.status != HTTPStatus.OK
+                    or response.cookies is not None
+                    or isinstance(response, http.StreamingResponse)
+                ):
+                    return response
+
+                # Cache, and send, the encoded body so hits and misses share the same bytes
+                response.body = bytes(response.encoded_body())
+                self.set(
+                    key,
+                    CachedResponse(
+                        response.body,
+                        response.content_type,
+                        response.status,
+                        list(response.headers),
+                        time.monotonic() + entry_ttl if entry_ttl is not None else None,
+                        frozenset(tags(request) if callable(tags) else tags),
+                    ),
+                )
+                return response
+
+            return cached_handler
+
+        return decorator
+
+    def get(self, key: CacheKey) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: CacheKey, entry: CachedResponse) -> None:
+        if entry.size > self.max_bytes:
+            log.debug("response for %s is too large to cache: %d bytes", key, entry.size)
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = entry
+        self.size += entry.size
+        for tag in entry.tags:
+            self._tagged.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            log.debug("evicting %s", oldest_key)
+            self._remove(oldest_key)
+
+    def invalidate(self, *tags: str) -> None:
+        """Remove every entry with any of 'tags'"""
+        for tag in tags:
+            for key in self._tagged.pop(tag, set()):
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tagged.clear()
+        self.size = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        for tag in entry.tags:
+            tagged = self._tagged.get(tag)
+            if tagged is None:
+                continue
+            tagged.discard(key)
+            if not tagged:
+                del self._tagged[tag]
+
+
+type BlockKey = tuple[type, str, str, tuple[Any, ...]]
+
+
+class BlockCache:
+    """
+    An in memory cache of rendered template blocks, used by Components that declare a 'cache_key'. Keyed on the
+    component class, template, block, and the values of the Context fields named by the component's cache key.
+    Entries expire after their TTL, and are evicted least recently used first once the cache holds more than
+    'max_entries' blocks. Safe to share between threads, as sync templates are rendered off the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[BlockKey, tuple[str, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: BlockKey) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            html, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return html
+
+    def set(self, key: BlockKey, html: str, ttl: float | None) -> None:
+        with self._lock:
+            self._entries[key] = (html, time.monotonic() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key, _ = self._entries.popitem(last=False)
+                log.debug("evicting block %s", oldest_key)
+
+    def invalidate(self, component: type) -> None:
+        """Remove every block rendered by 'component'"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] is component]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
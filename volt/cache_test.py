@@ -0,0 +1,159 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from volt import http
+from volt.cache import BlockCache, ResponseCache
+from volt.testing import make_request
+
+
+def test_cache_hit():
+    cache = ResponseCache()
+    calls: list[str] = []
+
+    @cache.cached(query_params=["page"])
+    async def handler(request: http.Request) -> http.Response:
+        calls.append(request.path)
+        return http.Response("rendered", headers=[http.Header("X-Rendered", "yes")])
+
+    response = asyncio.run(handler(make_request("/items", b"page=1&ignored=1")))
+    assert response.body == b"rendered"
+
+    response = asyncio.run(handler(make_request("/items", b"page=1&ignored=2")))
+    assert response.body == b"rendered"
+    assert response.headers.get("x-rendered") == "yes"
+    assert calls == ["/items"]
+
+    # Different selected query params, paths, or HTMX fragments are cached separately
+    _ = asyncio.run(handler(make_request("/items", b"page=2")))
+    _ = asyncio.run(handler(make_request("/other")))
+    hx_request = make_request("/items", b"page=1")
+    hx_request.hx_request = True
+    hx_request.hx_fragment = "list"
+    _ = asyncio.run(handler(hx_request))
+    assert len(calls) == 4
+    assert len(cache) == 4
+
+
+def test_cache_skips_uncacheable_responses():
+    cache = ResponseCache()
+    calls: list[str] = []
+
+    @cache.cached()
+    async def handler(request: http.Request) -> http.Response:
+        calls.append(request.path)
+        if request.path == "/missing":
+            return http.Response("missing", status=HTTPStatus.NOT_FOUND)
+        return http.StreamingResponse(["streamed"])
+
+    for _ in range(2):
+        _ = asyncio.run(handler(make_request("/missing")))
+        _ = asyncio.run(handler(make_request("/streamed")))
+
+    assert len(calls) == 4
+    assert len(cache) == 0
+
+
+def test_cache_ttl():
+    cache = ResponseCache()
+    calls: list[str] = []
+
+    @cache.cached(ttl=0.01)
+    async def handler(request: http.Request) -> http.Response:
+        calls.append(request.path)
+        return http.Response("rendered")
+
+    _ = asyncio.run(handler(make_request()))
+    _ = asyncio.run(handler(make_request()))
+    assert len(calls) == 1
+
+    time.sleep(0.02)
+    _ = asyncio.run(handler(make_request()))
+    assert len(calls) == 2
+
+
+def test_cache_eviction():
+    cache = ResponseCache(max_entries=2, max_bytes=100)
+
+    @cache.cached()
+    async def handler(request: http.Request) -> http.Response:
+        return http.Response("x" * 40 if request.path != "/large" else "x" * 101)
+
+    _ = asyncio.run(handler(make_request("/a")))
+    _ = asyncio.run(handler(make_request("/b")))
+    # Using '/a' makes '/b' the least recently used
+    _ = asyncio.run(handler(make_request("/a")))
+    _ = asyncio.run(handler(make_request("/c")))
+    assert len(cache) == 2
+    assert {key.path for key in cache._entries} == {"/a", "/c"}  # pyright: ignore[reportPrivateUsage]
+    assert cache.size == 80
+
+    # Responses larger than the whole cache are never stored
+    _ = asyncio.run(handler(make_request("/large")))
+    assert {key.path for key in cache._entries} == {"/a", "/c"}  # pyright: ignore[reportPrivateUsage]
+
+
+def test_cache_invalidate():
+    cache = ResponseCache()
+
+    @cache.cached(tags=lambda request: ["items", f"item:{request.path}"])
+    async def handler(request: http.Request) -> http.Response:
+        return http.Response("rendered")
+
+    _ = asyncio.run(handler(make_request("/1")))
+    _ = asyncio.run(handler(make_request("/2")))
+    assert len(cache) == 2
+
+    cache.invalidate("item:/1")
+    assert len(cache) == 1
+
+    cache.invalidate("items")
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_block_cache():
+    cache = BlockCache(max_entries=2)
+    a = (object, "page.html", "a", ())
+    b = (object, "page.html", "b", ())
+    c = (object, "page.html", "c", ())
+
+    cache.set(a, "a", None)
+    cache.set(b, "b", None)
+    # Using 'a' makes 'b' the least recently used
+    assert cache.get(a) == "a"
+    cache.set(c, "c", None)
+    assert cache.get(b) is None
+    assert cache.get(a) == "a"
+    assert len(cache) == 2
+
+    cache.set(b, "b", 0.01)
+    assert cache.get(b) == "b"
+    time.sleep(0.02)
+    assert cache.get(b) is None
+
+
+def test_block_cache_threads():
+    cache = BlockCache(max_entries=8)
+
+    def render(thread: int) -> None:
+        for i in range(2_000):
+            key = (object, "page.html", "content", ((thread + i) % 16,))
+            if cache.get(key) is None:
+                cache.set(key, "html", None)
+            if i % 10 == 0:
+                cache.invalidate(object)
+
+    # Sync renders run in worker threads, so the cache is used from several at once. Switch between them as often as
+    # possible, to interleave their reads and writes
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for result in [executor.submit(render, thread) for thread in range(8)]:
+                result.result()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert len(cache) <= 8
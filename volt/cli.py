@@ -1,19 +1,54 @@
 import sys
+from pathlib import Path
+
+from . import config
 from .generator import generate
+from .static import collect_static, compress_directory
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: volt <command>")
         print("Commands:")
-        print("  generate - Generate components from jinja2 templates")
+        print("  generate [--jobs N] - Generate components from jinja2 templates, parsing across N processes")
+        print("  compile-templates - Compile templates into the template bytecode cache ahead of time")
         print("  tailwind - Generate tailwind static css")
+        print("  compress-static [directory] - Write precompressed .br/.gz siblings of static files")
+        print("  collectstatic [directory] - Write fingerprinted copies of static files, and their manifest")
         sys.exit(1)
     
     command = sys.argv[1]
     
     match command:
         case "generate":
-            generate()
+            jobs = 1
+            if len(sys.argv) > 2:
+                if len(sys.argv) != 4 or sys.argv[2] not in ("--jobs", "-j") or not sys.argv[3].isdigit():
+                    print("Usage: volt generate [--jobs N]")
+                    sys.exit(1)
+                jobs = max(1, int(sys.argv[3]))
+            generate(jobs)
+        case "compile-templates":
+            if not config.template_bytecode_cache:
+                print("template_bytecode_cache must be enabled to compile templates ahead of time")
+                sys.exit(1)
+            # Imported here, so other commands don't set up the template environment
+            from .components import warm_templates
+
+            print(f"Compiled {warm_templates()} templates")
+        case "compress-static":
+            directory = Path(sys.argv[2] if len(sys.argv) > 2 else config.static_location)
+            if not directory.is_dir():
+                print(f"{directory} must be a directory")
+                sys.exit(1)
+            written = compress_directory(directory)
+            print(f"Wrote {len(written)} precompressed files")
+        case "collectstatic":
+            directory = Path(sys.argv[2] if len(sys.argv) > 2 else config.static_location)
+            if not directory.is_dir():
+                print(f"{directory} must be a directory")
+                sys.exit(1)
+            manifest = collect_static(directory)
+            print(f"Fingerprinted {len(manifest)} files")
         case _:
             print(f"Unknown command: {command}")
             sys.exit(1)
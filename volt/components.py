@@ -1,23 +1,81 @@
+import asyncio
 import logging
 
-from dataclasses import asdict, dataclass
-from typing import Any, NamedTuple
+from collections.abc import AsyncIterator, Iterator, Mapping
+from dataclasses import dataclass, fields
+import functools
+from pathlib import Path
+from typing import Any, ClassVar, NamedTuple, override
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import BytecodeCache, Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateSyntaxError
 
-from volt import config, http
+from volt import cache, config, http, static
 
 log = logging.getLogger("volt.py")
 
+bytecode_cache: BytecodeCache | None = None
+if config.template_bytecode_cache:
+    bytecode_cache = FileSystemBytecodeCache(config.template_bytecode_cache_location or None)
+
 environment = Environment(
     loader=FileSystemLoader(config.templates_location),
     auto_reload=config.template_auto_reload,
+    bytecode_cache=bytecode_cache,
+    enable_async=config.template_enable_async,
 )
 
 
+def warm_templates() -> int:
+    """
+    Load every template, so none are compiled while serving a request. With the bytecode cache, templates compiled
+    by an earlier process are loaded from disk instead. Files which aren't valid templates are logged and skipped.
+    Returns the number of templates loaded.
+    """
+    loaded = 0
+    for template_name in environment.list_templates():
+        try:
+            _ = environment.get_template(template_name)
+        except (TemplateSyntaxError, UnicodeDecodeError) as e:
+            log.warning("skipping template %s: %s", template_name, e)
+            continue
+        loaded += 1
+    log.debug("warmed %d templates", loaded)
+    return loaded
+
+
+def static_url(name: str) -> str:
+    """
+    The URL of the static file 'name', relative to the static directory. Resolves to the file's fingerprinted copy
+    once 'volt collectstatic' has been run. Available in templates as static('app.css').
+    """
+    manifest = static.get_manifest(Path(config.static_location), frozen=config.static_cache_frozen)
+    return f"{config.static_url_path}/{manifest.get(name)}"
+
+
+# Jinja types globals as its own default namespace, which has no room for other callables
+environment.globals["static"] = static_url  # pyright: ignore[reportArgumentType]
+
+# Rendered blocks of Components which declare a cache_key
+block_cache = cache.BlockCache(max_entries=config.block_cache_max_entries)
+
+
 Block = NamedTuple("Block", [("template_name", str), ("block_name", str)])
 
 
+class ContextBase:
+    """
+    What a Component needs from its context. Not a dataclass, so contexts can choose their own dataclass options,
+    such as slots or frozen, and must declare the 'request' and 'oob' fields themselves. Component.Context declares
+    them for contexts which don't need any options.
+    """
+
+    __slots__ = ()
+
+    # Declared for type checkers only. Every context is a dataclass which declares these as fields
+    request: http.Request  # pyright: ignore[reportUninitializedInstanceVariable]
+    oob: list["Component"]  # pyright: ignore[reportUninitializedInstanceVariable]
+
+
 class Component:
     """
     The Component class is the container for information pertaining to a particular 'block'
@@ -26,11 +84,19 @@ class Component:
     render. Ideally, there should be exactly one Component class defined, for every block.
     """
 
+    __slots__ = ("context",)
+
     template_name: str = ""
     block_name: str = config.htmx_default_block
+    # Names of the Context fields which determine how this component's block renders. When set, rendered blocks are
+    # kept in block_cache and reused for any context with the same values for these fields, which must be hashable.
+    # Full page renders depend on the whole context, so are never cached
+    cache_key: ClassVar[tuple[str, ...] | None] = None
+    # Seconds to reuse cached blocks for. None keeps them until they are evicted
+    cache_ttl: ClassVar[float | None] = None
 
     @dataclass
-    class Context:
+    class Context(ContextBase):
         """
         The default component is called 'content' if no alternative is provided,
         and will natively handle HTMX partial requests, by returning individual blocks. Out-Of-Band
@@ -41,36 +107,159 @@ class Component:
         request: http.Request
         oob: list["Component"]
 
-    context: Context
+    context: ContextBase
 
-    def __init__(self, context: Context) -> None:
+    def __init__(self, context: ContextBase) -> None:
         self.context = context
 
     def render(self, request: http.Request) -> str:
         assert self.template_name != "", f"template_name for class {self.__class__} must be defined"
 
         if request.hx_request:
-            context = asdict(self.context)
-            html = render_block(
-                environment,
-                self.template_name,
-                request.hx_fragment if request.hx_fragment is not None else self.block_name,
-                context,
-            )
+            html = self._render(request.hx_fragment if request.hx_fragment is not None else self.block_name)
             for component in self.context.oob:
-                html += render_block(
-                    environment,
-                    component.template_name,
-                    component.block_name,
-                    asdict(component.context),
-                )
+                html += component._render(component.block_name)
             return html
 
-        context = asdict(self.context)
-        template = environment.get_template(self.template_name)
-        html = template.render(context)
+        return self._render(None)
+
+    async def render_async(self, request: http.Request) -> str:
+        """
+        Render without blocking the event loop. Natively async with an async environment (template_enable_async),
+        otherwise the render runs in a worker thread.
+        """
+        if not environment.is_async:
+            return await asyncio.to_thread(self.render, request)
+
+        assert self.template_name != "", f"template_name for class {self.__class__} must be defined"
+
+        if request.hx_request:
+            block_name = request.hx_fragment if request.hx_fragment is not None else self.block_name
+            html = await self._render_async(block_name)
+            for component in self.context.oob:
+                html += await component._render_async(component.block_name)
+            return html
+
+        return await self._render_async(None)
+
+    async def generate_async(self, request: http.Request) -> AsyncIterator[str]:
+        """
+        Render chunk by chunk as the template produces output, to send with a StreamingResponse. Only streams with
+        an async environment, and for components without a cache key, otherwise the whole render is one chunk.
+        """
+        if not environment.is_async:
+            yield await self.render_async(request)
+            return
+
+        assert self.template_name != "", f"template_name for class {self.__class__} must be defined"
+
+        if request.hx_request:
+            block_name = request.hx_fragment if request.hx_fragment is not None else self.block_name
+            async for chunk in self._generate_async(block_name):
+                yield chunk
+            for component in self.context.oob:
+                async for chunk in component._generate_async(component.block_name):
+                    yield chunk
+            return
+
+        async for chunk in self._generate_async(None):
+            yield chunk
+
+    def _cache_key(self, block_name: str) -> cache.BlockKey:
+        assert self.cache_key is not None
+        return (
+            self.__class__,
+            self.template_name,
+            block_name,
+            tuple(getattr(self.context, field) for field in self.cache_key),
+        )
+
+    def _render(self, block_name: str | None) -> str:
+        """Render 'block_name', or the whole template if None, reusing a cached render of a block if there is one"""
+        if self.cache_key is None or block_name is None:
+            return self._render_uncached(block_name)
+
+        key = self._cache_key(block_name)
+        html = block_cache.get(key)
+        if html is None:
+            html = self._render_uncached(block_name)
+            block_cache.set(key, html, self.cache_ttl)
         return html
 
+    def _render_uncached(self, block_name: str | None) -> str:
+        context = ContextView(self.context)
+        if block_name is None:
+            return environment.get_template(self.template_name).render(context)
+        return render_block(environment, self.template_name, block_name, context)
+
+    async def _render_async(self, block_name: str | None) -> str:
+        if self.cache_key is None or block_name is None:
+            return await self._render_uncached_async(block_name)
+
+        key = self._cache_key(block_name)
+        html = block_cache.get(key)
+        if html is None:
+            html = await self._render_uncached_async(block_name)
+            block_cache.set(key, html, self.cache_ttl)
+        return html
+
+    async def _render_uncached_async(self, block_name: str | None) -> str:
+        context = ContextView(self.context)
+        if block_name is None:
+            return await environment.get_template(self.template_name).render_async(context)
+        return await render_block_async(environment, self.template_name, block_name, context)
+
+    async def _generate_async(self, block_name: str | None) -> AsyncIterator[str]:
+        if self.cache_key is not None and block_name is not None:
+            yield await self._render_async(block_name)
+            return
+
+        context = ContextView(self.context)
+        if block_name is None:
+            generator = environment.get_template(self.template_name).generate_async(context)
+        else:
+            generator = generate_block_async(environment, self.template_name, block_name, context)
+        async for chunk in generator:
+            yield chunk
+
+
+@functools.cache
+def _field_names(context_class: type) -> dict[str, None]:
+    # A dict rather than a set, to keep the fields' declaration order
+    return dict.fromkeys(field.name for field in fields(context_class))
+
+
+class ContextView(Mapping[str, Any]):
+    """
+    A read only mapping over the fields of a Context dataclass, passed to templates in place of a dict copy. Values
+    are read from the context as the template uses them, so nothing is copied, and nested dataclasses, lists and
+    Components are passed through as they are.
+    """
+
+    __slots__ = ("_context", "_names")
+
+    def __init__(self, context: Any) -> None:
+        self._context = context
+        self._names = _field_names(type(context))
+
+    @override
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._names:
+            raise KeyError(name)
+        return getattr(self._context, name)
+
+    @override
+    def __contains__(self, name: object) -> bool:
+        return name in self._names
+
+    @override
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    @override
+    def __len__(self) -> int:
+        return len(self._names)
+
 
 def render_block(
     environment: Environment,
@@ -80,9 +269,7 @@ def render_block(
     **kwargs: Any,
 ) -> str:
     if environment.is_async:
-        raise RuntimeError(
-            "render_block does not currently support async mode. See: https://github.com/trkl-dev/volt/issues/9"
-        )
+        raise RuntimeError("render_block does not support async environments, use render_block_async instead")
 
     template = environment.get_template(template_name)
     try:
@@ -98,6 +285,44 @@ def render_block(
         environment.handle_exception()
 
 
+async def render_block_async(
+    environment: Environment,
+    template_name: str,
+    block_name: str,
+    *args: Any,
+    **kwargs: Any,
+) -> str:
+    """render_block, for environments created with enable_async"""
+    chunks = [chunk async for chunk in generate_block_async(environment, template_name, block_name, *args, **kwargs)]
+    return environment.concat(chunks)
+
+
+async def generate_block_async(
+    environment: Environment,
+    template_name: str,
+    block_name: str,
+    *args: Any,
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """Render a block chunk by chunk, for environments created with enable_async"""
+    if not environment.is_async:
+        raise RuntimeError("generate_block_async requires an environment created with enable_async")
+
+    template = environment.get_template(template_name)
+    try:
+        block_render_func = template.blocks[block_name]
+    except KeyError:
+        raise BlockNotFoundError(block_name, template_name)
+
+    ctx = template.new_context(dict(*args, **kwargs))
+
+    try:
+        async for chunk in block_render_func(ctx):  # pyright: ignore[reportGeneralTypeIssues]
+            yield chunk
+    except Exception:
+        environment.handle_exception()
+
+
 class BlockNotFoundError(Exception):
     def __init__(self, block_name: str, template_name: str, message: str | None = None):
         super().__init__(message or f"Block {block_name} not in template {template_name}")
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import pytest
+from jinja2 import DictLoader, Environment
+
+from volt import components, http
+from volt.testing import make_request
+
+log = logging.getLogger("volt.components_test.py")
+
+TEMPLATES = {
+    "page.html": (
+        "<body>{% block navbar %}<nav>{{ selected }} {{ counter() }}</nav>{% endblock %}"
+        "{% block content %}<main>{{ title }}</main>{% endblock %}</body>"
+    ),
+    "table.html": "{% block rows %}{{ rows|length }} {{ rows[0].name }} {{ rows[0]['cells']|length }}{% endblock %}",
+}
+
+
+@pytest.fixture(autouse=True)
+def templates(monkeypatch: pytest.MonkeyPatch):
+    renders: list[int] = []
+
+    def counter() -> int:
+        renders.append(len(renders))
+        return len(renders)
+
+    monkeypatch.setattr(components.environment, "loader", DictLoader(TEMPLATES))
+    monkeypatch.setitem(components.environment.globals, "counter", counter)
+    components.block_cache.clear()
+    yield
+    components.block_cache.clear()
+
+
+class Page(components.Component):
+    template_name: str = "page.html"
+    block_name: str = "content"
+
+    @dataclass
+    class Context(components.Component.Context):
+        selected: str
+        title: str
+
+
+class NavBar(Page):
+    block_name: str = "navbar"
+    cache_key = ("selected",)
+
+
+def hx_request() -> http.Request:
+    request = make_request()
+    request.hx_request = True
+    return request
+
+
+def test_render():
+    request = make_request()
+    page = Page(Page.Context(request=request, oob=[], selected="home", title="Home"))
+    assert page.render(request) == "<body><nav>home 1</nav><main>Home</main></body>"
+
+    request = hx_request()
+    navbar = NavBar(NavBar.Context(request=request, oob=[], selected="home", title="Home"))
+    page = Page(Page.Context(request=request, oob=[navbar], selected="home", title="Home"))
+    assert page.render(request) == "<main>Home</main><nav>home 2</nav>"
+
+
+def test_block_cache():
+    request = hx_request()
+
+    def render(selected: str, title: str) -> str:
+        return NavBar(NavBar.Context(request=request, oob=[], selected=selected, title=title)).render(request)
+
+    assert render("home", "Home") == "<nav>home 1</nav>"
+    # Fields outside the cache key don't change the render
+    assert render("home", "Other") == "<nav>home 1</nav>"
+    assert render("features", "Home") == "<nav>features 2</nav>"
+    assert len(components.block_cache) == 2
+
+    # Full page renders depend on the whole context, so are never cached
+    page_request = make_request()
+    navbar = NavBar(NavBar.Context(request=page_request, oob=[], selected="home", title="Title A"))
+    assert navbar.render(page_request) == "<body><nav>home 3</nav><main>Title A</main></body>"
+    navbar = NavBar(NavBar.Context(request=page_request, oob=[], selected="home", title="Title B"))
+    assert navbar.render(page_request) == "<body><nav>home 4</nav><main>Title B</main></body>"
+    assert len(components.block_cache) == 2
+
+    components.block_cache.invalidate(NavBar)
+    assert len(components.block_cache) == 0
+    assert render("home", "Home") == "<nav>home 5</nav>"
+
+
+@dataclass
+class Row:
+    name: str
+    cells: list[str]
+
+
+class Table(components.Component):
+    template_name: str = "table.html"
+    block_name: str = "rows"
+
+    @dataclass
+    class Context(components.Component.Context):
+        rows: list[Row]
+
+
+def test_context_view():
+    request = make_request()
+    rows = [Row("row", ["cell"])]
+    context = Table.Context(request=request, oob=[], rows=rows)
+    view = components.ContextView(context)
+
+    assert list(view) == ["request", "oob", "rows"]
+    assert len(view) == 3
+    assert "rows" in view
+    assert "missing" not in view
+    # Values are the context's own, not copies
+    assert view["rows"] is rows
+    with pytest.raises(KeyError):
+        _ = view["missing"]
+
+    # Nested dataclasses are still readable by attribute and by item
+    assert Table(context).render(hx_request()) == "1 row 1"
+
+
+def test_context_view_benchmark():
+    """Rendering should not copy the context, so cost nothing extra for large lists"""
+    request = hx_request()
+    rows = [Row(f"row {i}", [f"cell {j}" for j in range(10)]) for i in range(5_000)]
+    context = Table.Context(request=request, oob=[], rows=rows)
+
+    def time_render(make_context: Callable[[Table.Context], Mapping[str, Any]]) -> float:
+        start = time.perf_counter()
+        for _ in range(10):
+            _ = components.render_block(components.environment, "table.html", "rows", make_context(context))
+        return time.perf_counter() - start
+
+    asdict_time = min(time_render(asdict) for _ in range(3))
+    view_time = min(time_render(components.ContextView) for _ in range(3))
+
+    log.info("list heavy context renders: asdict %.4fs, view %.4fs", asdict_time, view_time)
+    assert view_time * 5 < asdict_time
+
+
+def test_warm_templates(monkeypatch: pytest.MonkeyPatch):
+    loaded: list[str] = []
+    get_template = components.environment.get_template
+
+    def record_get_template(name: str) -> Any:
+        loaded.append(name)
+        return get_template(name)
+
+    monkeypatch.setattr(components.environment, "get_template", record_get_template)
+    assert components.warm_templates() == len(TEMPLATES)
+    assert sorted(loaded) == sorted(TEMPLATES)
+
+
+def test_warm_templates_invalid(monkeypatch: pytest.MonkeyPatch):
+    templates = {"valid.html": "{{ name }}", "syntax.html": "{% if %}"}
+    monkeypatch.setattr(components, "environment", Environment(loader=DictLoader(templates)))
+    # Invalid templates are skipped rather than failing startup
+    assert components.warm_templates() == 1
+
+
+@pytest.fixture
+def async_environment(monkeypatch: pytest.MonkeyPatch) -> Environment:
+    async_environment = Environment(loader=DictLoader(TEMPLATES), enable_async=True)
+    async_environment.globals.update(components.environment.globals)
+    monkeypatch.setattr(components, "environment", async_environment)
+    return async_environment
+
+
+def test_render_async(async_environment: Environment):
+    request = make_request()
+    page = Page(Page.Context(request=request, oob=[], selected="home", title="Home"))
+    assert asyncio.run(page.render_async(request)) == "<body><nav>home 1</nav><main>Home</main></body>"
+
+    request = hx_request()
+    navbar = NavBar(NavBar.Context(request=request, oob=[], selected="home", title="Home"))
+    page = Page(Page.Context(request=request, oob=[navbar], selected="home", title="Home"))
+    assert asyncio.run(page.render_async(request)) == "<main>Home</main><nav>home 2</nav>"
+    # The navbar is cached, as with sync renders
+    assert asyncio.run(page.render_async(request)) == "<main>Home</main><nav>home 2</nav>"
+
+    with pytest.raises(RuntimeError):
+        _ = components.render_block(async_environment, "page.html", "content", {"title": "Home"})
+    with pytest.raises(components.BlockNotFoundError):
+        _ = asyncio.run(components.render_block_async(async_environment, "page.html", "missing"))
+
+
+def test_generate_async(async_environment: Environment):
+    _ = async_environment
+
+    async def collect(component: components.Component, request: http.Request) -> list[str]:
+        return [chunk async for chunk in component.generate_async(request)]
+
+    request = make_request()
+    page = Page(Page.Context(request=request, oob=[], selected="home", title="Home"))
+    chunks = asyncio.run(collect(page, request))
+    assert len(chunks) > 1
+    assert "".join(chunks) == "<body><nav>home 1</nav><main>Home</main></body>"
+
+    request = hx_request()
+    navbar = NavBar(NavBar.Context(request=request, oob=[], selected="home", title="Home"))
+    page = Page(Page.Context(request=request, oob=[navbar], selected="home", title="Home"))
+    assert "".join(asyncio.run(collect(page, request))) == "<main>Home</main><nav>home 2</nav>"
+
+
+def test_render_async_sync_environment():
+    # Sync environments render in a worker thread
+    request = make_request()
+    page = Page(Page.Context(request=request, oob=[], selected="home", title="Home"))
+    assert asyncio.run(page.render_async(request)) == "<body><nav>home 1</nav><main>Home</main></body>"
@@ -59,6 +59,24 @@ template_auto_reload = get_config_value("template_auto_reload", default=False)
 log.debug("template_auto_reload: %s", template_auto_reload)
 
 
+# Create the template Environment with enable_async, so Component.render_async and generate_async render natively
+# async. Component.render can't be used from async code with this set. Default: False
+template_enable_async = get_config_value("template_enable_async", default=False)
+log.debug("template_enable_async: %s", template_enable_async)
+
+# Cache compiled templates on disk, so each worker process loads them rather than compiling them again. Default: True
+template_bytecode_cache = get_config_value("template_bytecode_cache", default=True)
+log.debug("template_bytecode_cache: %s", template_bytecode_cache)
+
+# Directory for the template bytecode cache. Default: Jinja2's directory in the system temp directory
+template_bytecode_cache_location = get_config_value("template_bytecode_cache_location", default="")
+log.debug("template_bytecode_cache_location: %s", template_bytecode_cache_location)
+
+# Load every template on lifespan startup, rather than on first use. Default: False
+template_warm_on_startup = get_config_value("template_warm_on_startup", default=False)
+log.debug("template_warm_on_startup: %s", template_warm_on_startup)
+
+
 # IP Address to run the server on. Default 127.0.0.1
 server_host = get_config_value("server_host", default="127.0.0.1")
 # Validate IP Address
@@ -82,5 +100,52 @@ log.debug("templates_location: %s", templates_location)
 require_component_types = get_config_value("require_component_types", default=False)
 log.debug("require_component_types: %s", require_component_types)
 
+# Generate components with __slots__, and contexts as slotted dataclasses where their inheritance allows. Default: False
+generate_slotted_contexts = get_config_value("generate_slotted_contexts", default=False)
+log.debug("generate_slotted_contexts: %s", generate_slotted_contexts)
+
+# Generate contexts as frozen dataclasses. Hand written contexts are unaffected. Default: False
+frozen_contexts = get_config_value("frozen_contexts", default=False)
+log.debug("frozen_contexts: %s", frozen_contexts)
+
+# Where 'volt generate' keeps the components extracted from each template, so unchanged templates aren't parsed again
+# Default: .volt_cache/generate.json
+generate_cache_location = get_config_value("generate_cache_location", default=".volt_cache/generate.json")
+log.debug("generate_cache_location: %s", generate_cache_location)
+
+# Static directory served by apps not given a static_location, whose manifest the 'static' template global resolves
+# names through, and the default for 'volt collectstatic'. Default: static
+static_location = get_config_value("static_location", default="static")
+log.debug("static_location: %s", static_location)
+
+# URL path static files are served under, and which the 'static' template global builds URLs from. Default: /static
+static_url_path = get_config_value("static_url_path", default="/static")
+log.debug("static_url_path: %s", static_url_path)
+
 htmx_default_block = get_config_value("htmx_default_block", default="content")
 log.debug("htmx_default_block: %s", htmx_default_block)
+
+# Maximum size of a request body in bytes. Larger bodies are rejected with 413 Content Too Large. Default: 1MiB
+max_body_size = get_config_value("max_body_size", default=1024 * 1024)
+log.debug("max_body_size: %s", max_body_size)
+
+# Serve cached static files without checking whether they have changed on disk. For production. Default: False
+static_cache_frozen = get_config_value("static_cache_frozen", default=False)
+log.debug("static_cache_frozen: %s", static_cache_frozen)
+
+# Static files up to this size in bytes are held in memory once served. Default: 256KiB
+static_cache_max_file_size = get_config_value("static_cache_max_file_size", default=256 * 1024)
+log.debug("static_cache_max_file_size: %s", static_cache_max_file_size)
+
+# Responses smaller than this in bytes are sent uncompressed by the compression middleware. Default: 512 bytes
+compression_min_size = get_config_value("compression_min_size", default=512)
+log.debug("compression_min_size: %s", compression_min_size)
+
+# Response bodies, or streamed chunks, of at least this size in bytes are compressed in a worker thread rather than
+# on the event loop. Default: 64KiB
+compression_offload_size = get_config_value("compression_offload_size", default=64 * 1024)
+log.debug("compression_offload_size: %s", compression_offload_size)
+
+# Maximum number of rendered blocks held for Components with a cache_key. Default: 1024
+block_cache_max_entries = get_config_value("block_cache_max_entries", default=1024)
+log.debug("block_cache_max_entries: %s", block_cache_max_entries)
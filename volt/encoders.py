@@ -0,0 +1,110 @@
+import zlib
+from typing import Protocol, final
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd  # pyright: ignore[reportMissingImports]
+except ImportError:
+    zstd = None
+
+# Content encodings available for compressing responses, in order of preference. gzip is always available, brotli
+# when the 'brotli' package is installed, and zstd from Python 3.14
+ENCODINGS: list[str] = [
+    *(["br"] if brotli is not None else []),
+    *(["zstd"] if zstd is not None else []),
+    "gzip",
+]
+
+
+def is_compressible(content_type: str) -> bool:
+    """Whether content of 'content_type' is text-like, so worth compressing"""
+    content_type = content_type.partition(";")[0].strip().lower()
+    return (
+        content_type.startswith("text/")
+        or content_type.endswith(("+json", "+xml"))
+        or content_type
+        in (
+            "application/javascript",
+            "application/json",
+            "application/xml",
+            "application/wasm",
+            "image/svg+xml",
+            "image/x-icon",
+            "image/vnd.microsoft.icon",
+        )
+    )
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compress 'data', flushing so everything given so far can be decompressed by the client"""
+        ...
+
+    def finish(self) -> bytes: ...
+
+
+@final
+class GzipCompressor:
+    def __init__(self, maximum: bool) -> None:
+        # wbits of 31 gives a gzip header and trailer
+        self._compressor = zlib.compressobj(9 if maximum else 6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+@final
+class BrotliCompressor:
+    def __init__(self, maximum: bool) -> None:
+        assert brotli is not None
+        self._compressor = brotli.Compressor(quality=11 if maximum else 4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+@final
+class ZstdCompressor:
+    def __init__(self, maximum: bool) -> None:
+        assert zstd is not None
+        self._compressor = zstd.ZstdCompressor(level=19 if maximum else 3)
+        self._flush_block = zstd.ZstdCompressor.FLUSH_BLOCK
+        self._flush_frame = zstd.ZstdCompressor.FLUSH_FRAME
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data, mode=self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(mode=self._flush_frame)
+
+
+def compressor(encoding: str, maximum: bool = False) -> Compressor:
+    """
+    A compressor for 'encoding', one of ENCODINGS. 'maximum' trades speed for the smallest output, for compressing
+    ahead of time rather than per request.
+    """
+    match encoding:
+        case "br":
+            return BrotliCompressor(maximum)
+        case "zstd":
+            return ZstdCompressor(maximum)
+        case "gzip":
+            return GzipCompressor(maximum)
+        case _:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def compress(data: bytes | bytearray | memoryview, encoding: str, maximum: bool = False) -> bytes:
+    """Compress the whole of 'data' with 'encoding'"""
+    encoding_compressor = compressor(encoding, maximum)
+    return encoding_compressor.compress(bytes(data)) + encoding_compressor.finish()
@@ -1,9 +1,32 @@
+from collections import deque
 from collections.abc import Iterable, Iterator
-from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+import functools
+import hashlib
+from itertools import repeat
+import json
 import logging
+import multiprocessing
 from pathlib import Path
+from typing import Any
+
 from jinja2 import Environment, FileSystemLoader, meta
-from jinja2.nodes import Block, ContextReference, DerivedContextReference, Expr, For, Name, Node, Tuple
+from jinja2.nodes import (
+    Assign,
+    AssignBlock,
+    Block,
+    CallBlock,
+    For,
+    FromImport,
+    Import,
+    Macro,
+    Name,
+    Node,
+    NSRef,
+    Tuple,
+    With,
+)
 
 from volt import config
 
@@ -23,31 +46,116 @@ class GeneratedComponent:
 class Context:
     components: list[GeneratedComponent]
     import_types: bool
+    slots: bool = False
+    slotted_components: list[str] = field(default_factory=list)
+    frozen: bool = False
 
 
-all_components: list[GeneratedComponent] = []
+# Bump whenever the components extracted from a template change, so stale caches are discarded
+CACHE_VERSION = 2
 
 
-def get_block_children(
-    block: Block, template_name: str, referenced_templates: Iterator[str | None], top_level: bool
-) -> Iterable[Block]:
-    blocks: list[Block] = []
+@dataclass
+class CachedTemplate:
+    source_hash: str
+    referenced_templates: list[str]
+    components: list[GeneratedComponent]
 
-    child_blocks = block.iter_child_nodes()
-    for child_block in child_blocks:
-        if not isinstance(child_block, Block):
-            continue
-        log.debug(f"Inspecting block: {child_block.name}")
-        blocks.append(child_block)
-        blocks.extend(get_block_children(child_block, template_name, referenced_templates, top_level=False))
 
-    # We want to make sure that we are excluding fields that are captured by parents. Since we are inheriting from
-    # these components, we don't want to require them on on the child components as well
-    parent_fields: list[str] = []
-    for parent_block in blocks:
-        parent_fields.extend(get_block_fields(parent_block))
+@dataclass
+class GenerateCache:
+    """
+    The components extracted from each template by previous runs, keyed by template name, along with a hash of the
+    template's source. Only templates whose source has changed, and templates referencing them, are parsed again.
+    """
+
+    templates: dict[str, CachedTemplate] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "GenerateCache":
+        """
+        The cache at 'path', or an empty cache if there isn't one, it was written by another version, or it can't be
+        read
+        """
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return cls()
+        except ValueError:
+            log.info("Discarding unreadable generate cache")
+            return cls()
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            log.info("Discarding generate cache from another version")
+            return cls()
+
+        try:
+            return cls(
+                templates={
+                    template_name: CachedTemplate(
+                        source_hash=template["source_hash"],
+                        referenced_templates=template["referenced_templates"],
+                        components=[GeneratedComponent(**component) for component in template["components"]],
+                    )
+                    for template_name, template in data["templates"].items()
+                }
+            )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            log.info("Discarding malformed generate cache")
+            return cls()
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": CACHE_VERSION,
+            "templates": {template_name: asdict(template) for template_name, template in self.templates.items()},
+        }
+        _ = path.write_text(json.dumps(data))
+
+    def stale_templates(self, source_hashes: dict[str, str]) -> set[str]:
+        """
+        The templates which must be parsed again: those which are new or changed, and those referencing changed or
+        removed templates, directly or through other templates.
+        """
+        changed = {
+            template_name
+            for template_name, source_hash in source_hashes.items()
+            if template_name not in self.templates or self.templates[template_name].source_hash != source_hash
+        }
+        changed.update(template_name for template_name in self.templates if template_name not in source_hashes)
+
+        dependents: dict[str, list[str]] = {}
+        for template_name, template in self.templates.items():
+            for referenced_template in template.referenced_templates:
+                dependents.setdefault(referenced_template, []).append(template_name)
+
+        stale = set(changed)
+        pending = list(changed)
+        while pending:
+            for dependent in dependents.get(pending.pop(), []):
+                if dependent not in stale:
+                    stale.add(dependent)
+                    pending.append(dependent)
+
+        return {template_name for template_name in stale if template_name in source_hashes}
 
-    fields = [field for field in get_block_fields(block) if field not in parent_fields]
+
+def get_block_children(
+    block: "TemplateBlock",
+    template_name: str,
+    referenced_templates: Iterator[str | None],
+    top_level: bool,
+    components: list[GeneratedComponent],
+) -> list["TemplateBlock"]:
+    """Add the components of 'block' and the blocks nested in it to 'components'. Returns the nested blocks"""
+    blocks: list[TemplateBlock] = []
+
+    for child_block in block.children:
+        log.debug(f"Inspecting block: {child_block.name}")
+        blocks.append(child_block)
+        blocks.extend(
+            get_block_children(child_block, template_name, referenced_templates, top_level=False, components=components)
+        )
 
     # Set the name to just be the name of the block, unless the block is a content block,
     # in which case we name it the file name
@@ -69,10 +177,10 @@ def get_block_children(
         template_name=template_name,
         block_name=block.name,
         parent_components=parent_components,
-        fields=fields,
+        fields=block.fields,
     )
     log.debug(f"Adding component: {component}")
-    all_components.append(component)
+    components.append(component)
     return blocks
 
 
@@ -85,118 +193,372 @@ def template_name_as_title(template_name: str) -> str:
     return template_name[: template_name.find(".")].title().replace("_", "")
 
 
-def get_block_fields(block: Block) -> list[str]:
-    fields: list[str] = []
-    for block_body_node in block.body:
-        excludes: list[Name] = []
-        # TODO: Vars used in a for loop must be iterable
-        # Can we also check if the target has fields, and use those as well?
-        # block.
-        fors = block.find_all(For)
-        for f in fors:
-            log.debug("Fors: %s", f)
-            # Regular For loop, e.g. for item in items -> item is the target
-            if isinstance(f.target, Name):
-                excludes.append(f.target)
-            # Occurs when unpacking as part of a for loop, e.g. for key, value in dict.items() -> (key, value) is the target
-            elif isinstance(f.target, Tuple):
-                for target in f.target.items:
-                    assert isinstance(target, Name)
-                    excludes.append(target)
-            else:
-                raise Exception(f"Unexpected For type: {type(f.target)} for {f.target}")
-
-        r = block_body_node.find_all(Node)
-        # log.debug("len(r): %d", len(list(r)))
-        for rr in r:
-            log.debug("r: %s", rr)
-        # TODO: Look at the `For` type and see if vars that are created from for loops can be omitted
-        names = block_body_node.find_all(Name)
+@dataclass
+class TemplateBlock:
+    name: str
+    # The fields the block needs in its context. Excludes fields also used by any nested block, as the block's
+    # component inherits them from the nested block's component
+    fields: list[str]
+    children: list["TemplateBlock"]
+
+
+class _BlockVisitor:
+    """
+    Collects the blocks of a template, their nesting, and the names each block reads from its context, in a single
+    pass over the template's AST. Names bound within the template, by for loops, with, set, macros and imports, are
+    not context fields while they are in scope.
+    """
+
+    def __init__(self) -> None:
+        self.blocks: list[TemplateBlock] = []
+        self._block: TemplateBlock | None = None
+        # The order each block was entered in, and for each name the latest entered block to read it. Blocks
+        # entered after a block, but before it is exited, are nested in it, so a name is read by a nested block
+        # exactly when its latest reader was entered after the block
+        self._entered = 0
+        self._block_entered = 0
+        self._latest_reader: dict[str, int] = {}
+        self._names: dict[str, None] = {}
+        # Counts of each bound name in scope, and the names bound in each open scope
+        self._bound: dict[str, int] = {}
+        self._scopes: list[list[str]] = []
+
+    def visit(self, node: Node) -> None:
+        match node:
+            case Name(ctx="load"):
+                if self._block is not None and node.name not in self._bound:
+                    self._names[node.name] = None
+                    self._latest_reader[node.name] = max(self._latest_reader.get(node.name, 0), self._block_entered)
+            case Block():
+                self._visit_block(node)
+            case For():
+                self.visit(node.iter)
+                self._open_scope([*_target_names(node.target), "loop"])
+                self._visit_all(node.body)
+                if node.test is not None:
+                    self.visit(node.test)
+                self._close_scope()
+                self._visit_all(node.else_)
+            case With():
+                self._visit_all(node.values)
+                self._open_scope([name for target in node.targets for name in _target_names(target)])
+                self._visit_all(node.body)
+                self._close_scope()
+            case Macro() | CallBlock():
+                if isinstance(node, CallBlock):
+                    self.visit(node.call)
+                else:
+                    self._bind([node.name])
+                self._visit_all(node.defaults)
+                self._open_scope([*(arg.name for arg in node.args), "caller", "varargs", "kwargs"])
+                self._visit_all(node.body)
+                self._close_scope()
+            case Assign():
+                self.visit(node.node)
+                self._bind(_target_names(node.target))
+            case AssignBlock():
+                self._visit_all(node.body)
+                if node.filter is not None:
+                    self.visit(node.filter)
+                self._bind(_target_names(node.target))
+            case Import():
+                self._bind([node.target])
+            case FromImport():
+                self._bind([name if isinstance(name, str) else name[1] for name in node.names])
+            case _:
+                for child in node.iter_child_nodes():
+                    self.visit(child)
+
+    def _visit_all(self, nodes: Iterable[Node]) -> None:
+        for node in nodes:
+            self.visit(node)
+
+    def _visit_block(self, node: Block) -> None:
+        outer_block, outer_entered, outer_names = self._block, self._block_entered, self._names
+        outer_bound, outer_scopes = self._bound, self._scopes
+
+        block = TemplateBlock(name=node.name, fields=[], children=[])
+        (outer_block.children if outer_block is not None else self.blocks).append(block)
+        self._block, self._block_entered, self._names = block, self._entered, {}
+        self._entered += 1
+        # Blocks can't see names bound around them, unless they are scoped
+        if not node.scoped:
+            self._bound, self._scopes = {}, []
+
+        self._open_scope([])
+        self._visit_all(node.body)
+        self._close_scope()
+
+        block.fields = [name for name in self._names if self._latest_reader[name] == self._block_entered]
+
+        self._block, self._block_entered, self._names = outer_block, outer_entered, outer_names
+        self._bound, self._scopes = outer_bound, outer_scopes
+
+    def _open_scope(self, names: list[str]) -> None:
+        self._scopes.append([])
+        self._bind(names)
+
+    def _bind(self, names: Iterable[str]) -> None:
         for name in names:
-            log.debug("name: %s", name)
-            skip = False
-            for exc in excludes:
-                if name.name == exc.name:
-                    skip = True
-                    break
-            if skip:
-                continue
-            already_exists = False
-            if name.ctx == "load":
-                for var in fields:
-                    if name.name == var:
-                        already_exists = True
-                if not already_exists:
-                    fields.append(name.name)
+            self._bound[name] = self._bound.get(name, 0) + 1
+            if self._scopes:
+                self._scopes[-1].append(name)
 
-    return fields
+    def _close_scope(self) -> None:
+        for name in self._scopes.pop():
+            self._bound[name] -= 1
+            if self._bound[name] == 0:
+                del self._bound[name]
 
 
-# TODO: Check against templates without blocks
-def _generate(environment: Environment, import_types: bool) -> str:
-    context = Context(
-        components=[],
-        import_types=import_types,
+def _target_names(target: Node) -> list[str]:
+    # Regular for loops and assignments bind a Name, e.g. for item in items, while unpacking binds a Tuple of them,
+    # e.g. for key, value in dict.items()
+    if isinstance(target, Name):
+        return [target.name]
+    if isinstance(target, Tuple):
+        return [name for item in target.items for name in _target_names(item)]
+    if isinstance(target, NSRef):
+        return []
+    raise Exception(f"Unexpected target type: {type(target)} for {target}")
+
+
+def get_template_blocks(template_ast: Node) -> list[TemplateBlock]:
+    """The outermost blocks of a template, with the blocks nested in them, and the fields each block needs"""
+    visitor = _BlockVisitor()
+    visitor.visit(template_ast)
+    return visitor.blocks
+
+
+def get_block_fields(block: Block) -> list[str]:
+    """The fields 'block' needs in its context, excluding those also used by blocks nested in it"""
+    return get_template_blocks(block)[0].fields
+
+
+class ComponentOrderError(Exception): ...
+
+
+def order_components(components: list[GeneratedComponent]) -> list[GeneratedComponent]:
+    """
+    Order 'components' so each comes after all of its parents, as the generated classes inherit from them. A
+    topological sort, using Kahn's algorithm, which otherwise keeps the order given. Raises ComponentOrderError for
+    parents which aren't components, and for components which inherit from themselves through their parents.
+    """
+    indices_by_name: dict[str, list[int]] = {}
+    for index, component in enumerate(components):
+        indices_by_name.setdefault(component.name, []).append(index)
+
+    # Components are only ready once every component with each of their parents' names has been ordered
+    unordered_by_name = {name: len(indices) for name, indices in indices_by_name.items()}
+    unordered_parents: list[int] = []
+    children: dict[str, list[int]] = {}
+    for index, component in enumerate(components):
+        parent_names = set(component.parent_components)
+        for parent_name in parent_names:
+            if parent_name not in indices_by_name:
+                raise ComponentOrderError(
+                    f"Component {component.name} from {component.template_name} has unknown parent {parent_name}"
+                )
+            children.setdefault(parent_name, []).append(index)
+        unordered_parents.append(len(parent_names))
+
+    ready = deque(index for index, count in enumerate(unordered_parents) if count == 0)
+    ordered: list[GeneratedComponent] = []
+    while ready:
+        component = components[ready.popleft()]
+        ordered.append(component)
+
+        unordered_by_name[component.name] -= 1
+        if unordered_by_name[component.name] != 0:
+            continue
+        for child in children.get(component.name, []):
+            unordered_parents[child] -= 1
+            if unordered_parents[child] == 0:
+                ready.append(child)
+
+    if len(ordered) != len(components):
+        cyclic = sorted({component.name for index, component in enumerate(components) if unordered_parents[index]})
+        raise ComponentOrderError(f"Components inherit from themselves through their parents: {', '.join(cyclic)}")
+
+    return ordered
+
+
+def slotted_components(components: list[GeneratedComponent]) -> set[str]:
+    """
+    The names of the components whose contexts can be slotted dataclasses. A class can't inherit from two classes
+    which each add slots, so the contexts of every component inherited, however indirectly, by a component with
+    several parents are left unslotted.
+    """
+    parents_by_name: dict[str, list[str]] = {}
+    for component in components:
+        parents_by_name.setdefault(component.name, []).extend(component.parent_components)
+
+    unslotted: set[str] = set()
+    pending = [
+        parent
+        for component in components
+        if len(set(component.parent_components)) > 1
+        for parent in component.parent_components
+    ]
+    while pending:
+        name = pending.pop()
+        if name in unslotted:
+            continue
+        unslotted.add(name)
+        pending.extend(parents_by_name.get(name, []))
+
+    return {component.name for component in components if component.name not in unslotted}
+
+
+def parse_template(environment: Environment, template_name: str, template_source: str) -> CachedTemplate:
+    """Extract the components of a single template"""
+    log.info(f"Parsing template: {template_name}")
+    template_ast = environment.parse(template_source)
+
+    referenced_template_names = [name for name in meta.find_referenced_templates(template_ast) if name is not None]
+    referenced_templates = iter(referenced_template_names)
+
+    components: list[GeneratedComponent] = []
+    parent_components: list[str] = []
+    for block in get_template_blocks(template_ast):
+        log.debug(f"Inspecting block: {block.name}")
+        _ = get_block_children(block, template_name, referenced_templates, top_level=True, components=components)
+        parent_components.append(template_name_as_title(template_name) + name_as_title(block.name))
+
+    name = template_name_as_title(template_name)
+    components.append(
+        GeneratedComponent(
+            name=name,
+            template_name=template_name,
+            block_name="content",
+            parent_components=parent_components,
+            fields=[],
+        )
     )
 
-    if environment.loader is None:
-        raise Exception("No environment loader")
+    return CachedTemplate(
+        source_hash=_source_hash(template_source),
+        referenced_templates=referenced_template_names,
+        components=components,
+    )
 
-    template_names = environment.list_templates()
-    for template_name in template_names:
-        log.info(f"Parsing template: {template_name}")
-        template_source = environment.loader.get_source(environment, template_name)[0]
-        template_ast = environment.parse(template_source)
 
+# The Environment options which change how templates are parsed
+_SYNTAX_OPTIONS = (
+    "block_start_string",
+    "block_end_string",
+    "variable_start_string",
+    "variable_end_string",
+    "comment_start_string",
+    "comment_end_string",
+    "line_statement_prefix",
+    "line_comment_prefix",
+    "trim_blocks",
+    "lstrip_blocks",
+    "newline_sequence",
+    "keep_trailing_newline",
+)
+
+type Syntax = tuple[tuple[str, Any], ...]
+
+
+def _syntax(environment: Environment) -> Syntax:
+    """What a worker process needs to parse templates as 'environment' does, which can't be sent to it whole"""
+    return (
+        *((option, getattr(environment, option)) for option in _SYNTAX_OPTIONS),
+        ("extensions", tuple(environment.extensions)),
+    )
 
-        # r = template_ast.find_all(DerivedContextReference)
-        # log.debug("len(r): %d", len(list(r)))
-        # for rr in r:
-        #     log.debug("r: %s", rr)
 
-        referenced_templates = meta.find_referenced_templates(template_ast)
+@functools.cache
+def _syntax_environment(syntax: Syntax) -> Environment:
+    return Environment(**dict(syntax))
 
-        template_blocks: list[Block] = []
-        parent_components: list[str] = []
-        blocks = template_ast.iter_child_nodes()
-        for block in blocks:
 
-            # r = block.find_all(DerivedContextReference)
-            # log.debug("len(r): %d", len(list(r)))
-            # for rr in r:
-            #     log.debug("r: %s", rr)
+def _parse_template_in_worker(syntax: Syntax, template_name: str, template_source: str) -> CachedTemplate:
+    return parse_template(_syntax_environment(syntax), template_name, template_source)
 
-            if not isinstance(block, Block):
-                continue
-            log.debug(f"Inspecting block: {block.name}")
-            template_blocks.extend(get_block_children(block, template_name, referenced_templates, top_level=True))
-            parent_components.append(template_name_as_title(template_name) + name_as_title(block.name))
-
-        name = template_name_as_title(template_name)
-        all_components.append(
-            GeneratedComponent(
-                name=name,
-                template_name=template_name,
-                block_name="content",
-                parent_components=parent_components,
-                fields=[],
-            )
-        )
 
-    # Add all components without parents
-    for c in all_components:
-        if len(list(c.parent_components)) != 0:
-            continue
-        context.components.append(c)
+def _source_hash(template_source: str) -> str:
+    return hashlib.blake2b(template_source.encode(), digest_size=16).hexdigest()
 
-    while len(all_components) != len(context.components):
-        for c in all_components:
-            if c in context.components:
-                continue
-            if not all(pc in [cc.name for cc in context.components] for pc in c.parent_components):
-                continue
 
-            context.components.append(c)
+# TODO: Check against templates without blocks
+def _generate(
+    environment: Environment,
+    import_types: bool,
+    cache: GenerateCache | None = None,
+    jobs: int = 1,
+    slots: bool = False,
+    frozen: bool = False,
+) -> str:
+    """
+    Render the generated components module for every template in 'environment'. Given a 'cache', only templates
+    which have changed since it was last updated are parsed, and the cache is updated in place. With 'jobs' above
+    one, templates are parsed across that many worker processes. Components are always merged in template order,
+    so the output doesn't depend on which worker finishes first.
+
+    With 'slots', components get __slots__, and contexts are slotted dataclasses wherever their inheritance allows.
+    With 'frozen', contexts are frozen dataclasses. With either, contexts derive from ContextBase rather than the
+    Component.Context dataclass, so they can choose their own dataclass options.
+    """
+    context = Context(
+        components=[],
+        import_types=import_types,
+        slots=slots,
+        frozen=frozen,
+    )
+
+    if environment.loader is None:
+        raise Exception("No environment loader")
+
+    if cache is None:
+        cache = GenerateCache()
+
+    template_sources = {
+        template_name: environment.loader.get_source(environment, template_name)[0]
+        for template_name in environment.list_templates()
+    }
+    stale_templates = cache.stale_templates(
+        {template_name: _source_hash(template_source) for template_name, template_source in template_sources.items()}
+    )
+    log.info(f"Parsing {len(stale_templates)} of {len(template_sources)} templates")
+
+    stale_names = [template_name for template_name in template_sources if template_name in stale_templates]
+    stale_sources = [template_sources[template_name] for template_name in stale_names]
+    if jobs > 1 and len(stale_names) > 1:
+        # Spawned rather than forked, as forking a process that's running threads can deadlock the workers
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(jobs, len(stale_names)), mp_context=mp_context) as executor:
+            parsed = list(
+                executor.map(
+                    _parse_template_in_worker,
+                    repeat(_syntax(environment)),
+                    stale_names,
+                    stale_sources,
+                    chunksize=max(1, len(stale_names) // (jobs * 4)),
+                )
+            )
+    else:
+        parsed = [
+            parse_template(environment, template_name, template_source)
+            for template_name, template_source in zip(stale_names, stale_sources)
+        ]
+    parsed_templates = dict(zip(stale_names, parsed))
+
+    templates: dict[str, CachedTemplate] = {}
+    for template_name in template_sources:
+        if template_name in parsed_templates:
+            templates[template_name] = parsed_templates[template_name]
+        else:
+            templates[template_name] = cache.templates[template_name]
+    cache.templates = templates
+
+    components = [component for template in templates.values() for component in template.components]
+    context.components = order_components(components)
+    if slots:
+        slotted = slotted_components(context.components)
+        context.slotted_components = [component.name for component in context.components if component.name in slotted]
 
     parent_dir = Path(__file__).parent
     gen_environment = Environment(loader=FileSystemLoader(parent_dir), trim_blocks=True, lstrip_blocks=True)
@@ -206,13 +568,23 @@ def _generate(environment: Environment, import_types: bool) -> str:
     return output
 
 
-def generate():
+def generate(jobs: int = 1):
     templates_location = Path(config.templates_location)
     if not templates_location.is_dir():
         raise Exception(f"{config.templates_location} must be a directory")
 
     environment = Environment(loader=FileSystemLoader(templates_location))
-    output = _generate(environment, config.require_component_types)
+    cache_location = Path(config.generate_cache_location)
+    cache = GenerateCache.load(cache_location)
+    output = _generate(
+        environment,
+        config.require_component_types,
+        cache,
+        jobs,
+        slots=config.generate_slotted_contexts,
+        frozen=config.frozen_contexts,
+    )
+    cache.save(cache_location)
     with open("components_gen.py", "w") as f:
         len_written = f.write(output)
         assert len_written == len(output)
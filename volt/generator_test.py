@@ -1,6 +1,21 @@
+import json
+import logging
+import time
+from dataclasses import FrozenInstanceError, dataclass
+from pathlib import Path
+from typing import Any
+
+import pytest
 from jinja2 import DictLoader, Environment
+from jinja2.nodes import Node
+
+from volt import generator
+from volt.testing import make_request
+from volt.components import Component
 from volt.generator import _generate
 
+log = logging.getLogger("volt.generator_test.py")
+
 
 def test_generate():
     templates = {
@@ -91,3 +106,260 @@ class About(AboutContent):
 
 """
     assert output == expected_output
+
+
+def test_generate_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    templates = {
+        "about.html": '{% extends "base.html" %}{% block content %}{{ title }}{% endblock %}',
+        "base.html": "{% block content %}{% endblock %}{% block footer %}{{ year }}{% endblock %}",
+        "home.html": "{% block content %}{{ greeting }}{% endblock %}",
+    }
+    environment = Environment(loader=DictLoader(templates))
+
+    parsed: list[str] = []
+    parse_template = generator.parse_template
+
+    def record_parse_template(environment: Environment, template_name: str, template_source: str):
+        parsed.append(template_name)
+        return parse_template(environment, template_name, template_source)
+
+    monkeypatch.setattr(generator, "parse_template", record_parse_template)
+
+    cache_path = tmp_path / "generate.json"
+    cache = generator.GenerateCache.load(cache_path)
+    output = _generate(environment, import_types=False, cache=cache)
+    cache.save(cache_path)
+    assert sorted(parsed) == ["about.html", "base.html", "home.html"]
+
+    # Nothing has changed, so nothing is parsed, and the output is the same
+    parsed.clear()
+    cache = generator.GenerateCache.load(cache_path)
+    assert _generate(environment, import_types=False, cache=cache) == output
+    assert parsed == []
+
+    # Changed templates are parsed again, along with templates extending them
+    templates["base.html"] = "{% block content %}{% endblock %}{% block footer %}{{ copyright }}{% endblock %}"
+    parsed.clear()
+    changed_output = _generate(environment, import_types=False, cache=cache)
+    assert sorted(parsed) == ["about.html", "base.html"]
+    assert "copyright: Any" in changed_output
+
+    # Removed templates are dropped from the cache
+    del templates["home.html"]
+    parsed.clear()
+    _ = _generate(environment, import_types=False, cache=cache)
+    assert parsed == []
+    assert list(cache.templates) == ["about.html", "base.html"]
+
+    # Caches written before blocks were extracted in a single pass hold different components, so are discarded
+    v1_template = {
+        "source_hash": "0",
+        "referenced_templates": [],
+        "components": [
+            {
+                "name": "Home",
+                "template_name": "home.html",
+                "block_name": "content",
+                "parent_components": [],
+                "fields": ["loop"],
+            }
+        ],
+    }
+    _ = cache_path.write_text(json.dumps({"version": 1, "templates": {"home.html": v1_template}}))
+    assert generator.GenerateCache.load(cache_path).templates == {}
+    _ = cache_path.write_text(json.dumps({"version": generator.CACHE_VERSION, "templates": {"home.html": v1_template}}))
+    assert list(generator.GenerateCache.load(cache_path).templates) == ["home.html"]
+
+    # Caches from other versions are discarded
+    monkeypatch.setattr(generator, "CACHE_VERSION", generator.CACHE_VERSION + 1)
+    assert generator.GenerateCache.load(cache_path).templates == {}
+
+    # As are caches which can't be read, rather than failing the run
+    version = generator.CACHE_VERSION
+    _ = cache_path.write_text("{")
+    assert generator.GenerateCache.load(cache_path).templates == {}
+    for malformed in [
+        [],
+        {"version": version},
+        {"version": version, "templates": []},
+        {"version": version, "templates": {"home.html": {"source_hash": "0"}}},
+        {
+            "version": version,
+            "templates": {
+                "home.html": {"source_hash": "0", "referenced_templates": [], "components": [{"unknown": 1}]}
+            },
+        },
+    ]:
+        _ = cache_path.write_text(json.dumps(malformed))
+        assert generator.GenerateCache.load(cache_path).templates == {}, malformed
+
+
+def make_component(name: str, *parent_components: str) -> generator.GeneratedComponent:
+    return generator.GeneratedComponent(name, f"{name.lower()}.html", "content", list(parent_components), [])
+
+
+def test_order_components():
+    components = [
+        make_component("AboutContent", "Base"),
+        make_component("About", "AboutContent"),
+        make_component("BaseContent"),
+        make_component("Base", "BaseContent"),
+        make_component("Home", "Base", "BaseContent"),
+    ]
+    ordered = generator.order_components(components)
+    assert [component.name for component in ordered] == ["BaseContent", "Base", "AboutContent", "Home", "About"]
+
+    with pytest.raises(generator.ComponentOrderError, match="unknown parent Missing"):
+        _ = generator.order_components([make_component("About", "Missing")])
+
+    with pytest.raises(generator.ComponentOrderError, match="A, B$"):
+        _ = generator.order_components([make_component("A", "B"), make_component("B", "A"), make_component("C")])
+
+
+def test_order_components_benchmark():
+    """Ordering should be linear in the number of components, even for a single long chain of parents"""
+    components = [make_component("Component0")]
+    components.extend(make_component(f"Component{i}", f"Component{i - 1}") for i in range(1, 20_000))
+    components.reverse()
+
+    start = time.perf_counter()
+    ordered = generator.order_components(components)
+    elapsed = time.perf_counter() - start
+
+    log.info("ordered %d components in %.4fs", len(components), elapsed)
+    assert [component.name for component in ordered[:2]] == ["Component0", "Component1"]
+    assert elapsed < 1
+
+
+def test_get_template_blocks():
+    environment = Environment()
+    template_ast = environment.parse("""
+{{ outside }}
+{% block page %}
+{% set title = heading %}
+{{ title }} {{ user }}
+{% for row in rows if row.visible %}{{ row }} {{ loop.index }} {{ columns }}{% else %}{{ row }}{% endfor %}
+{% with count = total %}{{ count }}{% endwith %}
+{% macro cell(value) %}{{ value }} {{ caller() }}{% endmacro %}
+{{ cell(user) }}
+{% if show %}{% block nav %}{{ user }} {{ title }} {{ selected }}{% endblock %}{% endif %}
+{% block sidebar scoped %}{{ title }} {{ links }}{% endblock %}
+{% endblock %}
+{% block footer %}{{ year }}{% endblock %}
+""")
+    blocks = generator.get_template_blocks(template_ast)
+    assert [block.name for block in blocks] == ["page", "footer"]
+
+    page, footer = blocks
+    # 'user' is used by the nested nav block, so is inherited from its component
+    assert page.fields == ["heading", "rows", "columns", "row", "total", "show"]
+    assert [block.name for block in page.children] == ["nav", "sidebar"]
+
+    nav, sidebar = page.children
+    # Unscoped blocks can't see names set around them
+    assert nav.fields == ["user", "title", "selected"]
+    assert sidebar.fields == ["links"]
+    assert footer.fields == ["year"]
+
+
+def test_get_template_blocks_benchmark():
+    """Field extraction should be linear in the size of the template, however deeply its blocks are nested"""
+
+    def deep_template(depth: int) -> str:
+        opening = "".join(
+            f"{{% block block{i} %}}{{{{ field{i} }}}}{{% for item in items{i} %}}{{{{ item }}}}{{% endfor %}}"
+            for i in range(depth)
+        )
+        return opening + "{% endblock %}" * depth
+
+    environment = Environment()
+    shallow_ast = environment.parse(deep_template(40))
+    deep_ast = environment.parse(deep_template(160))
+
+    def time_extraction(template_ast: Node) -> float:
+        start = time.perf_counter()
+        for _ in range(20):
+            _ = generator.get_template_blocks(template_ast)
+        return time.perf_counter() - start
+
+    shallow_time = min(time_extraction(shallow_ast) for _ in range(3))
+    deep_time = min(time_extraction(deep_ast) for _ in range(3))
+
+    log.info("field extraction: depth 40 %.4fs, depth 160 %.4fs", shallow_time, deep_time)
+    # Four times the template, so four times the work. Quadratic extraction would be sixteen times
+    assert deep_time < shallow_time * 8
+
+
+def test_generate_jobs():
+    templates = {
+        f"page_{i}.html": f'{{% extends "base.html" %}}{{% block content %}}{{{{ field_{i} }}}}{{% endblock %}}'
+        for i in range(8)
+    }
+    templates["base.html"] = "{% block content %}{% endblock %}{% block footer %}{{ year }}{% endblock %}"
+    environment = Environment(loader=DictLoader(templates), trim_blocks=True)
+
+    output = _generate(environment, import_types=False)
+    assert _generate(environment, import_types=False, jobs=4) == output
+    # Calls don't share any state
+    assert _generate(environment, import_types=False) == output
+
+
+def test_generate_slots():
+    templates = {
+        "about.html": '{% extends "base.html" %}{% block content %}{{ title }}{% endblock %}',
+        "base.html": "{% block content %}{{ heading }}{% endblock %}{% block footer %}{{ year }}{% endblock %}",
+        "home.html": "{% block content %}{{ greeting }}{% endblock %}",
+    }
+    environment = Environment(loader=DictLoader(templates))
+    output = _generate(environment, import_types=False, slots=True)
+
+    # Base inherits from both of its blocks, so their contexts can't both add slots
+    components = [
+        component
+        for template_name, template_source in templates.items()
+        for component in generator.parse_template(environment, template_name, template_source).components
+    ]
+    assert generator.slotted_components(components) == {"AboutContent", "About", "Base", "HomeContent", "Home"}
+
+    namespace: dict[str, Any] = {}
+    exec(output, namespace)
+    request = make_request()
+
+    home = namespace["Home"]
+    component = home(home.Context(request=request, oob=[], greeting="Hello"))
+    assert not hasattr(component, "__dict__")
+    assert not hasattr(component.context, "__dict__")
+    assert component.context.greeting == "Hello"
+
+    # Contexts inheriting unslotted contexts still work, they just keep a __dict__
+    about = namespace["About"]
+    component = about(about.Context(request=request, oob=[], heading="Heading", year=2026, title="About"))
+    assert component.context.title == "About"
+
+    # Frozen contexts don't inherit the mutable Component.Context dataclass, so the module can be imported
+    for slots in (False, True):
+        namespace = {}
+        exec(_generate(environment, import_types=False, slots=slots, frozen=True), namespace)
+
+        home = namespace["Home"]
+        component = home(home.Context(request=request, oob=[], greeting="Hello"))
+        assert component.context.greeting == "Hello"
+        assert hasattr(component.context, "__dict__") is not slots
+        with pytest.raises(FrozenInstanceError):
+            component.context.greeting = "Goodbye"
+
+        about = namespace["About"]
+        component = about(about.Context(request=request, oob=[], heading="Heading", year=2026, title="About"))
+        assert component.context.title == "About"
+        with pytest.raises(FrozenInstanceError):
+            component.context.title = "Changed"
+
+    # Hand written contexts keep working alongside generated ones
+    class Hand(Component):
+        @dataclass
+        class Context(Component.Context):
+            name: str
+
+    context = Hand.Context(request=request, oob=[], name="hand")
+    context.name = "changed"
+    assert context.name == "changed"
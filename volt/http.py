@@ -1,10 +1,25 @@
+import asyncio
+import hashlib
+import json
 import logging
-from collections.abc import Callable, Coroutine
+import re
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+from functools import cached_property
 from http import HTTPMethod, HTTPStatus
 from http import cookies as http_cookies
-from typing import Any, TypedDict, override
+from typing import Any, TypedDict, cast, override
+from urllib.parse import parse_qs
 
-from volt import asgi
+from volt import asgi, config
 
 
 log = logging.getLogger("volt")
@@ -15,9 +30,15 @@ class Header:
     Format Ref: https://developers.cloudflare.com/rules/transform/request-header-modification/reference/header-format/
     """
 
+    __slots__ = ("name", "value")
+
     name: str
     value: str
 
+    # Match the first invalid char. '\w' covers exactly the chars where str.isalnum() is true, plus '_'
+    _invalid_name_char: re.Pattern[str] = re.compile(r"[^\w-]")
+    _invalid_value_char: re.Pattern[str] = re.compile(r"[^\w :;.,\\/\"'?!(){}\[\]@<>=\-+*#$&`|~^%]")
+
     def __init__(self, name: str, value: str) -> None:
         self.validate_name(name)
         self.validate_value(value)
@@ -26,29 +47,29 @@ class Header:
         self.value = value
 
     @classmethod
-    def validate_name(cls, name: str):
-        for char in name:
-            if char in "-_":
-                continue
-
-            if char.isalnum():
-                continue
+    def trusted(cls, name: str, value: str) -> "Header":
+        """
+        Create a header without validating it. Only for headers that have already been parsed by the ASGI server
+        """
+        header = cls.__new__(cls)
+        header.name = name
+        header.value = value
+        return header
 
+    @classmethod
+    def validate_name(cls, name: str):
+        invalid_char = cls._invalid_name_char.search(name)
+        if invalid_char is not None:
             raise Exception(
-                f"Header name is invalid. Invalid char: {char}. Valid characters are: a-z, A-Z, 0-9 - and _"
+                f"Header name is invalid. Invalid char: {invalid_char.group()}. Valid characters are: a-z, A-Z, 0-9 - and _"
             )
 
     @classmethod
     def validate_value(cls, value: str) -> None:
-        for char in value:
-            if char in r"_ :;.,\/\"'?!(){}[]@<>=-+*#$&`|~^%":
-                continue
-
-            if char.isalnum():
-                continue
-
+        invalid_char = cls._invalid_value_char.search(value)
+        if invalid_char is not None:
             raise Exception(
-                rf"Header name is invalid. Invalid char: {char}. Valid characters are: a-z, A-Z, 0-9, _ :;.,\/\"'?!(){{}}[]@<>=-+*#$&`|~^%"
+                rf"Header name is invalid. Invalid char: {invalid_char.group()}. Valid characters are: a-z, A-Z, 0-9, _ :;.,\/\"'?!(){{}}[]@<>=-+*#$&`|~^%"
             )
 
     @override
@@ -56,66 +77,346 @@ class Header:
         return f"Header<{self.name}: {self.value}>"
 
 
+class Headers:
+    """
+    An ordered collection of headers, allowing repeated names. Lookups are case-insensitive, and backed by an index
+    on the lowercased header names, built once as headers are added.
+    """
+
+    __slots__ = ("_headers", "_index")
+
+    def __init__(self, headers: Iterable[Header] | None = None) -> None:
+        self._headers: list[Header] = []
+        self._index: dict[str, list[str]] = {}
+        if headers is not None:
+            for header in headers:
+                self.append(header)
+
+    @classmethod
+    def from_raw(cls, raw_headers: Iterable[tuple[bytes, bytes]]) -> "Headers":
+        """Build headers from the raw (name, value) byte pairs of an ASGI scope"""
+        return cls(Header.trusted(name.decode(), value.decode()) for name, value in raw_headers)
+
+    def append(self, header: Header) -> None:
+        self._headers.append(header)
+        values = self._index.get(header.name.lower())
+        if values is None:
+            self._index[header.name.lower()] = [header.value]
+        else:
+            values.append(header.value)
+
+    def set(self, header: Header) -> None:
+        """Replace every header with the same name as 'header' with 'header'"""
+        name = header.name.lower()
+        if name in self._index:
+            self._headers = [existing for existing in self._headers if existing.name.lower() != name]
+            del self._index[name]
+        self.append(header)
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        """The value of the first header called 'name', or 'default' if there are none"""
+        values = self._index.get(name.lower())
+        if values is None:
+            return default
+        return values[0]
+
+    def getall(self, name: str) -> list[str]:
+        """The values of every header called 'name', in order"""
+        return list(self._index.get(name.lower(), ()))
+
+    def raw(self) -> list[tuple[bytes, bytes]]:
+        """The headers as (name, value) byte pairs, as sent in an ASGI response start event"""
+        return [(header.name.encode(), header.value.encode()) for header in self._headers]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower() in self._index
+
+    def __iter__(self) -> Iterator[Header]:
+        return iter(self._headers)
+
+    def __len__(self) -> int:
+        return len(self._headers)
+
+    @override
+    def __repr__(self) -> str:
+        return f"Headers<{self._headers}>"
+
+
 type FormData = dict[str, list[str]]
 
 
+class PayloadTooLargeError(Exception):
+    def __init__(self, max_body_size: int, *args: object) -> None:
+        super().__init__(f"Request body exceeds the maximum body size of {max_body_size} bytes", *args)
+
+
+class ClientDisconnectError(Exception): ...
+
+
 class Request:
-    method: HTTPMethod
-    path: str
-    body: str
-    form_data: FormData
-    headers: list[Header]
-    cookies: http_cookies.SimpleCookie
-    query_params: dict[str, list[str]]
+    """
+    An incoming HTTP request. Wraps the raw ASGI scope, with each attribute decoded on first access and cached from
+    then on, so handlers only pay for what they read. The body is only received from the client once the handler
+    asks for it, either buffered whole with body(), text(), json() or form(), or chunk by chunk with stream().
+    """
+
+    scope: asgi.HTTPScope
     route_params: dict[str, str | int]
     hx_request: bool
     hx_fragment: str | None
 
     def __init__(
         self,
-        method: str,
-        path: str,
-        body: str,
-        form_data: FormData,
-        headers: list[Header],
-        cookies: http_cookies.SimpleCookie,
-        query_params: dict[str, list[str]],
+        scope: asgi.HTTPScope,
+        receive: asgi.ASGIReceiveCallable,
         route_params: dict[str, str | int],
     ) -> None:
-        self.method = HTTPMethod[method]
-        self.path = path
-        self.body = body
-        self.form_data = form_data
-        self.headers = headers
-        self.cookies = cookies
-        self.query_params = query_params
+        self.scope = scope
         self.route_params = route_params
         self.hx_request = False
         self.hx_fragment = None
+        self._receive = receive
+        self._body: bytes | None = None
+        self._stream_consumed = False
+
+    @cached_property
+    def method(self) -> HTTPMethod:
+        try:
+            return HTTPMethod(self.scope["method"])
+        except ValueError:
+            log.error("unexpected HTTP method")
+            raise
+
+    @property
+    def path(self) -> str:
+        return self.scope["path"]
+
+    @cached_property
+    def headers(self) -> Headers:
+        return Headers.from_raw(self.scope["headers"])
+
+    @cached_property
+    def cookies(self) -> http_cookies.SimpleCookie:
+        cookies = http_cookies.SimpleCookie()
+        for cookie in self.headers.getall("cookie"):
+            cookies.load(cookie)
+        return cookies
+
+    @cached_property
+    def query_params(self) -> dict[str, list[str]]:
+        return parse_qs(self.scope["query_string"].decode())
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        Iterate over the request body as it is received, without buffering it. Raises PayloadTooLargeError once more
+        than config.max_body_size bytes have been received.
+        """
+        if self._body is not None:
+            yield self._body
+            return
+
+        if self._stream_consumed:
+            raise RuntimeError("Request body has already been consumed")
+        self._stream_consumed = True
+
+        received = 0
+        while True:
+            event = await self._receive()
+            match event["type"]:
+                case "http.request":
+                    chunk = event.get("body", b"")
+                    received += len(chunk)
+                    if received > config.max_body_size:
+                        raise PayloadTooLargeError(config.max_body_size)
+                    if chunk:
+                        yield chunk
+                    if not event.get("more_body", False):
+                        return
+                case "http.disconnect":
+                    raise ClientDisconnectError()
+                case _:
+                    raise RuntimeError(f"Unexpected event: {event}")
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            self._body = b"".join([chunk async for chunk in self.stream()])
+            log.debug(f"request body: {self._body}")
+        return self._body
+
+    async def text(self) -> str:
+        return (await self.body()).decode()
+
+    async def json(self) -> Any:
+        return json.loads(await self.body())
+
+    async def form(self) -> FormData:
+        if self.headers.get("content-type") != "application/x-www-form-urlencoded":
+            return {}
+
+        form_data = parse_qs(await self.text())
+        log.debug(f"parsed form data: {form_data}")
+        return form_data
+
+
+type Body = str | bytes | bytearray | memoryview
+
+# Responses that never have a body, so must not describe one
+BODILESS_STATUSES = frozenset((HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED))
 
 
 class Response:
-    body: str
+    """
+    A response to send to the client. The body may be str, which is encoded as UTF-8 when sent, or any bytes-like
+    object, which is sent as is.
+    """
+
+    body: Body
     content_type: str
     status: HTTPStatus
-    headers: list[Header]
+    headers: Headers
     cookies: http_cookies.SimpleCookie | None
 
     def __init__(
         self,
-        body: str = "",
+        body: Body = "",
         content_type: str = "text/html",
         status: HTTPStatus = HTTPStatus.OK,
-        headers: list[Header] | None = None,
+        headers: Headers | Iterable[Header] | None = None,
         cookies: http_cookies.SimpleCookie | None = None,
     ) -> None:
         self.body = body
         self.content_type = content_type
         self.status = status
 
-        self.headers = headers if headers is not None else []
+        self.headers = headers if isinstance(headers, Headers) else Headers(headers)
         self.cookies = cookies
 
+    def raw_headers(self) -> list[tuple[bytes, bytes]]:
+        """All headers for the response, including content-type and any cookies, as sent to the client"""
+        headers = [(b"content-type", self.content_type.encode()), *self.headers.raw()]
+
+        if self.cookies is not None:
+            for cookie in self.cookies.values():
+                headers.append((b"set-cookie", cookie.OutputString().encode()))
+
+        return headers
+
+    def encoded_body(self) -> bytes | bytearray | memoryview:
+        if isinstance(self.body, str):
+            return self.body.encode()
+        return self.body
+
+    async def respond(self, receive: asgi.ASGIReceiveCallable, send: asgi.ASGISendCallable) -> None:
+        """Send the response to the client"""
+        _ = receive
+        body = self.encoded_body()
+        headers = self.raw_headers()
+        if "content-length" not in self.headers and self.status not in BODILESS_STATUSES:
+            content_length = body.nbytes if isinstance(body, memoryview) else len(body)
+            headers.append((b"content-length", str(content_length).encode()))
+
+        start_event: asgi.HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": headers,
+        }
+        await send(start_event)
+
+        response_body: asgi.HTTPResponseBodyEvent = {
+            "type": "http.response.body",
+            "body": body,  # pyright: ignore[reportAssignmentType]
+        }
+        await send(response_body)
+
+
+type StreamingContent = Iterable[str | bytes] | AsyncIterable[str | bytes]
+
+
+class StreamingResponse(Response):
+    """
+    A response whose body is sent chunk by chunk as it is produced by 'content', an iterator or async iterator of
+    str or bytes. Sync iterators are advanced in a worker thread, so they can block without stalling the event loop.
+    Streaming stops early if the client disconnects.
+    """
+
+    body_iterator: AsyncIterator[str | bytes]
+
+    def __init__(
+        self,
+        content: StreamingContent,
+        content_type: str = "text/html",
+        status: HTTPStatus = HTTPStatus.OK,
+        headers: Headers | Iterable[Header] | None = None,
+        cookies: http_cookies.SimpleCookie | None = None,
+    ) -> None:
+        super().__init__(content_type=content_type, status=status, headers=headers, cookies=cookies)
+        if isinstance(content, AsyncIterable):
+            self.body_iterator = aiter(content)
+        else:
+            self.body_iterator = iterate_in_thread(content)
+
+    @override
+    async def respond(self, receive: asgi.ASGIReceiveCallable, send: asgi.ASGISendCallable) -> None:
+        start_event: asgi.HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": self.raw_headers(),
+        }
+        await send(start_event)
+
+        stream_task = asyncio.create_task(self._stream_body(send))
+        disconnect_task = asyncio.create_task(_wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait((stream_task, disconnect_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (stream_task, disconnect_task):
+                if not task.done():
+                    _ = task.cancel()
+            _ = await asyncio.gather(stream_task, disconnect_task, return_exceptions=True)
+
+        if disconnect_task in done:
+            log.debug("client disconnected, stopped streaming response")
+            if isinstance(self.body_iterator, AsyncGenerator):
+                await self.body_iterator.aclose()
+            return
+
+        # Raise any exception from producing the body
+        stream_task.result()
+
+    async def _stream_body(self, send: asgi.ASGISendCallable) -> None:
+        async for chunk in self.body_iterator:
+            response_body: asgi.HTTPResponseBodyEvent = {
+                "type": "http.response.body",
+                "body": chunk.encode() if isinstance(chunk, str) else chunk,
+                "more_body": True,
+            }
+            await send(response_body)
+
+        final_response_body: asgi.HTTPResponseBodyEvent = {
+            "type": "http.response.body",
+            "body": b"",
+            "more_body": False,
+        }
+        await send(final_response_body)
+
+
+async def _wait_for_disconnect(receive: asgi.ASGIReceiveCallable) -> None:
+    while True:
+        event = await receive()
+        if event["type"] == "http.disconnect":
+            return
+
+
+async def iterate_in_thread[T](iterable: Iterable[T]) -> AsyncIterator[T]:
+    """Iterate over a sync iterable, advancing it in a worker thread"""
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield cast(T, item)
+
 
 class Redirect(Response):
     """
@@ -133,6 +434,59 @@ class Redirect(Response):
 type Handler = Callable[[Request], Coroutine[Any, Any, Response]]
 
 
+def etag(body: bytes | bytearray | memoryview) -> str:
+    """A strong entity tag for 'body'"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether 'etag' matches any entity tag in the value of an If-None-Match header. As per RFC 9110, this is a weak
+    comparison, so weak tags match their strong equivalents.
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def negotiate_encoding(accept_encoding: str | None, supported: Sequence[str]) -> str | None:
+    """
+    The content encoding in 'supported' most preferred by the client, as per the value of its Accept-Encoding
+    header, or None if it accepts none of them. Ties go to whichever is listed first in 'supported'.
+    """
+    if accept_encoding is None:
+        return None
+
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        name, _, value = params.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in supported:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+
+    return best_encoding
+
+
+def status_response(status: HTTPStatus) -> Response:
+    """A plain text response, with the status phrase as the body"""
+    return Response(status.phrase, content_type="text/plain", status=status)
+
+
 async def generic_response(send: asgi.ASGISendCallable, status: HTTPStatus) -> None:
     start_event: asgi.HTTPResponseStartEvent = {
         "type": "http.response.start",
@@ -0,0 +1,123 @@
+import logging
+import time
+from collections.abc import Callable
+
+import pytest
+
+from volt import http
+
+log = logging.getLogger("volt.test.py")
+
+
+def test_headers():
+    headers = http.Headers.from_raw(
+        [
+            (b"Content-Type", b"text/html"),
+            (b"cookie", b"a=1"),
+            (b"Cookie", b"b=2"),
+        ]
+    )
+
+    assert len(headers) == 3
+    assert "content-type" in headers
+    assert "CONTENT-TYPE" in headers
+    assert "accept" not in headers
+
+    assert headers.get("content-type") == "text/html"
+    assert headers.get("Content-type") == "text/html"
+    assert headers.get("accept") is None
+    assert headers.get("accept", "*/*") == "*/*"
+
+    assert headers.get("cookie") == "a=1"
+    assert headers.getall("COOKIE") == ["a=1", "b=2"]
+    assert headers.getall("accept") == []
+
+    # Original casing and order are kept for iteration and sending
+    assert [header.name for header in headers] == ["Content-Type", "cookie", "Cookie"]
+    assert headers.raw() == [(b"Content-Type", b"text/html"), (b"cookie", b"a=1"), (b"Cookie", b"b=2")]
+
+    headers.set(http.Header("COOKIE", "c=3"))
+    assert headers.getall("cookie") == ["c=3"]
+    assert [header.name for header in headers] == ["Content-Type", "COOKIE"]
+
+
+def test_response_headers():
+    response = http.Response(headers=[http.Header("A-Header", "here")])
+    response.headers.append(http.Header("a-header", "there"))
+
+    assert isinstance(response.headers, http.Headers)
+    assert response.headers.getall("A-HEADER") == ["here", "there"]
+
+    response = http.Response()
+    assert len(response.headers) == 0
+
+
+def _validate_value_per_char(value: str) -> bool:
+    """The original char by char header value validation, kept as a reference for Header.validate_value"""
+    for char in value:
+        if char in r"_ :;.,\/\"'?!(){}[]@<>=-+*#$&`|~^%":
+            continue
+
+        if char.isalnum():
+            continue
+
+        return False
+    return True
+
+
+def _validate_name_per_char(name: str) -> bool:
+    """The original char by char header name validation, kept as a reference for Header.validate_name"""
+    return all(char in "-_" or char.isalnum() for char in name)
+
+
+def _is_valid(validate: Callable[[str], None], value: str) -> bool:
+    try:
+        validate(value)
+    except Exception:
+        return False
+    return True
+
+
+def test_header_validation():
+    # Every code point in the Basic Multilingual Plane should be accepted or rejected exactly as the per char
+    # validation would
+    for code_point in range(0x10000):
+        char = chr(code_point)
+        assert _is_valid(http.Header.validate_name, char) == _validate_name_per_char(char), repr(char)
+        assert _is_valid(http.Header.validate_value, char) == _validate_value_per_char(char), repr(char)
+
+    _ = http.Header("X-Valid_Name", "some value; with=chars")
+    with pytest.raises(Exception, match="Invalid char: :"):
+        _ = http.Header("Invalid:Name", "value")
+    with pytest.raises(Exception, match="Invalid char: \n"):
+        _ = http.Header("Name", "line\nbreak")
+
+
+def test_trusted_header():
+    header = http.Header.trusted("Invalid:Name", "line\nbreak")
+    assert header.name == "Invalid:Name"
+    assert header.value == "line\nbreak"
+
+
+def test_header_validation_benchmark():
+    """
+    Validating a large header value with a precompiled regex should accept the same values as checking char by
+    char. The timings are logged for comparison, not asserted on, as wall clock time varies between runs
+    """
+    value = "session=" + "a1b2c3d4-" * 1_000
+    assert _validate_value_per_char(value)
+    assert _is_valid(http.Header.validate_value, value)
+    assert not _is_valid(http.Header.validate_value, value + "\n")
+    assert not _validate_value_per_char(value + "\n")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        _ = _validate_value_per_char(value)
+    per_char_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        http.Header.validate_value(value)
+    regex_time = time.perf_counter() - start
+
+    log.info("header value validation: per char %.4fs, regex %.4fs", per_char_time, regex_time)
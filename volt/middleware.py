@@ -1,7 +1,9 @@
-from collections.abc import Coroutine
+import asyncio
+from collections.abc import AsyncGenerator, AsyncIterator, Coroutine
+from http import HTTPMethod, HTTPStatus
 from typing import Any, Callable
 
-from volt import http
+from volt import config, encoders, http
 
 type MiddlewareType = Callable[[http.Request, http.Handler], Coroutine[Any, Any, http.Response]]
 
@@ -21,11 +23,114 @@ def create_middleware_stack(handler: http.Handler, *middlewares: MiddlewareType)
 
 async def htmx(request: http.Request, handler: http.Handler) -> http.Response:
     """Parse the provided request and update HTMX related attributes accordingly"""
-    for header in request.headers:
-        if header.name.lower() == "hx-request" and header.value.lower() == "true":
-            request.hx_request = True
+    hx_request = request.headers.get("hx-request")
+    if hx_request is not None and hx_request.lower() == "true":
+        request.hx_request = True
 
-        if header.name.lower() == "hx-fragment":
-            request.hx_fragment = header.value
+    request.hx_fragment = request.headers.get("hx-fragment")
 
     return await handler(request)
+
+
+# Headers copied from a 200 response onto the 304 answering it, besides the ETag
+_NOT_MODIFIED_HEADERS = ("cache-control", "expires", "vary")
+
+
+async def etag(request: http.Request, handler: http.Handler) -> http.Response:
+    """
+    Tag successful GET and HEAD responses with an ETag computed from the body, and answer requests whose
+    If-None-Match already has that ETag with 304 Not Modified. Streamed responses are passed through untouched.
+    """
+    response = await handler(request)
+    if (
+        request.method not in (HTTPMethod.GET, HTTPMethod.HEAD)
+        or response.status != HTTPStatus.OK
+        or isinstance(response, http.StreamingResponse)
+    ):
+        return response
+
+    response_etag = response.headers.get("etag")
+    if response_etag is None:
+        response_etag = http.etag(response.encoded_body())
+        response.headers.append(http.Header("ETag", response_etag))
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and http.etag_matches(if_none_match, response_etag):
+        # A 304 carries the caching headers the 200 would have, so caches update their stored copy
+        return http.Response(
+            status=HTTPStatus.NOT_MODIFIED,
+            headers=[
+                http.Header("ETag", response_etag),
+                *(header for header in response.headers if header.name.lower() in _NOT_MODIFIED_HEADERS),
+            ],
+            content_type=response.content_type,
+        )
+
+    return response
+
+
+async def compression(request: http.Request, handler: http.Handler) -> http.Response:
+    """
+    Compress text-like responses with the best content encoding the client accepts: brotli or zstd when available,
+    otherwise gzip. Bodies smaller than config.compression_min_size are sent as is, as are responses which are
+    already encoded or set their own content-length. Streamed responses are compressed chunk by chunk, each flushed
+    so the client can render it straight away. Large bodies and chunks are compressed in a worker thread.
+    """
+    response = await handler(request)
+    if (
+        response.status in http.BODILESS_STATUSES
+        or "content-encoding" in response.headers
+        or "content-length" in response.headers
+        or not encoders.is_compressible(response.content_type)
+    ):
+        return response
+
+    # The response differs by Accept-Encoding from here on, even if this client gets it uncompressed
+    if not any("accept-encoding" in vary.lower() for vary in response.headers.getall("vary")):
+        response.headers.append(http.Header("Vary", "Accept-Encoding"))
+
+    encoding = http.negotiate_encoding(request.headers.get("accept-encoding"), encoders.ENCODINGS)
+    if encoding is None:
+        return response
+
+    if isinstance(response, http.StreamingResponse):
+        response.body_iterator = _compress_stream(response.body_iterator, encoding)
+    else:
+        body = response.encoded_body()
+        body_size = body.nbytes if isinstance(body, memoryview) else len(body)
+        if body_size < config.compression_min_size:
+            return response
+
+        if body_size >= config.compression_offload_size:
+            compressed = await asyncio.to_thread(encoders.compress, body, encoding)
+        else:
+            compressed = encoders.compress(body, encoding)
+
+        if len(compressed) >= body_size:
+            return response
+        response.body = compressed
+
+    response.headers.append(http.Header("Content-Encoding", encoding))
+    # The compressed bytes differ from those a strong ETag was computed from
+    response_etag = response.headers.get("etag")
+    if response_etag is not None and not response_etag.startswith("W/"):
+        response.headers.set(http.Header("ETag", f"W/{response_etag}"))
+
+    return response
+
+
+async def _compress_stream(body_iterator: AsyncIterator[str | bytes], encoding: str) -> AsyncIterator[bytes]:
+    compressor = encoders.compressor(encoding)
+    try:
+        async for chunk in body_iterator:
+            data = chunk.encode() if isinstance(chunk, str) else chunk
+            if len(data) >= config.compression_offload_size:
+                compressed = await asyncio.to_thread(compressor.compress, data)
+            else:
+                compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+    finally:
+        if isinstance(body_iterator, AsyncGenerator):
+            await body_iterator.aclose()
@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+
+import pytest
+
+from volt import encoders, http, middleware
+from volt.testing import make_request
+
+
+async def page(_request: http.Request) -> http.Response:
+    return http.Response("<p>page</p>")
+
+
+def test_htmx():
+    async def handler(request: http.Request) -> http.Response:
+        return http.Response(f"{request.hx_request} {request.hx_fragment}")
+
+    response = asyncio.run(middleware.htmx(make_request(), handler))
+    assert response.body == "False None"
+
+    request = make_request(headers=[(b"HX-Request", b"true"), (b"HX-Fragment", b"list")])
+    response = asyncio.run(middleware.htmx(request, handler))
+    assert response.body == "True list"
+
+
+def test_etag():
+    response = asyncio.run(middleware.etag(make_request(), page))
+    assert response.status == HTTPStatus.OK
+    etag = response.headers.get("etag")
+    assert etag is not None
+    assert etag == http.etag(b"<p>page</p>")
+
+    response = asyncio.run(middleware.etag(make_request(headers=[(b"if-none-match", etag.encode())]), page))
+    assert response.status == HTTPStatus.NOT_MODIFIED
+    assert response.body == ""
+    assert response.headers.get("etag") == etag
+
+    # Weak and listed tags match too
+    if_none_match = f'"other", W/{etag}'.encode()
+    response = asyncio.run(middleware.etag(make_request(headers=[(b"if-none-match", if_none_match)]), page))
+    assert response.status == HTTPStatus.NOT_MODIFIED
+
+    response = asyncio.run(middleware.etag(make_request(headers=[(b"if-none-match", b'"other"')]), page))
+    assert response.status == HTTPStatus.OK
+
+    response = asyncio.run(middleware.etag(make_request(method="POST"), page))
+    assert "etag" not in response.headers
+
+
+def test_etag_not_modified_headers():
+    async def cached_page(_request: http.Request) -> http.Response:
+        return http.Response(
+            "<p>page</p>",
+            headers=[
+                http.Header("Cache-Control", "max-age=60"),
+                http.Header("Vary", "HX-Request"),
+                http.Header("Expires", "Thu, 01 Jan 2099 00:00:00 GMT"),
+                http.Header("X-Other", "dropped"),
+            ],
+        )
+
+    if_none_match = http.etag(b"<p>page</p>").encode()
+    response = asyncio.run(middleware.etag(make_request(headers=[(b"if-none-match", if_none_match)]), cached_page))
+    assert response.status == HTTPStatus.NOT_MODIFIED
+    assert response.headers.get("cache-control") == "max-age=60"
+    assert response.headers.get("vary") == "HX-Request"
+    assert response.headers.get("expires") == "Thu, 01 Jan 2099 00:00:00 GMT"
+    assert "x-other" not in response.headers
+
+
+async def large_page(_request: http.Request) -> http.Response:
+    return http.Response("<p>page</p>" * 100, headers=[http.Header("ETag", '"tag"')])
+
+
+def test_compression(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(encoders, "ENCODINGS", ["gzip"])
+
+    request = make_request(headers=[(b"accept-encoding", b"gzip, deflate")])
+    response = asyncio.run(middleware.compression(request, large_page))
+    assert response.headers.get("content-encoding") == "gzip"
+    assert response.headers.get("vary") == "Accept-Encoding"
+    assert response.headers.get("etag") == 'W/"tag"'
+    assert isinstance(response.body, bytes)
+    assert gzip.decompress(response.body) == b"<p>page</p>" * 100
+
+    # Clients that don't accept any supported encoding still need to know the response varies
+    identity_request = make_request(headers=[(b"accept-encoding", b"identity")])
+    response = asyncio.run(middleware.compression(identity_request, large_page))
+    assert "content-encoding" not in response.headers
+    assert response.headers.get("vary") == "Accept-Encoding"
+    assert response.body == "<p>page</p>" * 100
+
+    # Small bodies aren't worth compressing
+    response = asyncio.run(middleware.compression(request, page))
+    assert "content-encoding" not in response.headers
+    assert response.body == "<p>page</p>"
+
+    async def image(_request: http.Request) -> http.Response:
+        return http.Response(b"\x00" * 1024, content_type="image/png")
+
+    response = asyncio.run(middleware.compression(request, image))
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+@pytest.mark.parametrize("encoding", encoders.ENCODINGS)
+def test_compression_encodings(monkeypatch: pytest.MonkeyPatch, encoding: str):
+    monkeypatch.setattr(middleware.config, "compression_offload_size", 1024)
+
+    request = make_request(headers=[(b"accept-encoding", encoding.encode())])
+    response = asyncio.run(middleware.compression(request, large_page))
+    assert response.headers.get("content-encoding") == encoding
+    assert isinstance(response.body, bytes)
+    assert len(response.body) < len("<p>page</p>" * 100)
+
+
+def test_compression_streaming(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(encoders, "ENCODINGS", ["gzip"])
+
+    async def stream(_request: http.Request) -> http.Response:
+        async def chunks() -> AsyncIterator[str]:
+            for i in range(3):
+                yield f"<p>{i}</p>"
+
+        return http.StreamingResponse(chunks())
+
+    request = make_request(headers=[(b"accept-encoding", b"gzip")])
+    response = asyncio.run(middleware.compression(request, stream))
+    assert isinstance(response, http.StreamingResponse)
+    assert response.headers.get("content-encoding") == "gzip"
+
+    async def collect() -> list[str | bytes]:
+        return [chunk async for chunk in response.body_iterator]
+
+    chunks = asyncio.run(collect())
+    # Each chunk is flushed, so can be decompressed as soon as it arrives
+    assert len(chunks) == 4
+    body = b"".join(chunk for chunk in chunks if isinstance(chunk, bytes))
+    assert gzip.decompress(body) == b"<p>0</p><p>1</p><p>2</p>"
@@ -0,0 +1,644 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import shutil
+import stat
+import time
+from collections.abc import Mapping
+from datetime import UTC
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, final
+
+from volt import asgi, encoders, http
+
+log = logging.getLogger("volt.static.py")
+
+CHUNK_SIZE = 64 * 1024  # 64KB Chunk size
+
+# The extensions of precompressed siblings of static files, by content encoding, in order of preference
+PRECOMPRESSED_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# Written by collect_static into the static directory
+MANIFEST_NAME = "manifest.json"
+
+# How often, in seconds, an unfrozen manifest checks whether it has changed on disk
+MANIFEST_CHECK_INTERVAL = 1.0
+
+# Fingerprinted files never change, so browsers can keep them for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+
+@final
+class StaticFile:
+    """
+    A static file, with everything needed to serve it. 'content' holds the file itself for small files, so they can
+    be served without touching the disk.
+    """
+
+    __slots__ = (
+        "content",
+        "content_encoding",
+        "content_type",
+        "etag",
+        "last_modified",
+        "mtime_ns",
+        "path",
+        "size",
+    )
+
+    def __init__(
+        self,
+        path: Path,
+        size: int,
+        mtime_ns: int,
+        content_type: str,
+        content_encoding: str | None,
+        content: bytes | None,
+    ) -> None:
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.content = content
+        # Strong validators, derived from the file's mtime and size, so they can be checked without reading the file
+        self.etag = f'"{mtime_ns:x}-{size:x}"'
+        self.last_modified = formatdate(mtime_ns / 1_000_000_000, usegmt=True)
+
+    def not_modified(self, request_headers: http.Headers) -> bool:
+        """Whether the request's conditional headers show the client's copy of the file is still current"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return http.etag_matches(if_none_match, self.etag)
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+
+        try:
+            modified_since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates are always GMT, so a date without a timezone is invalid rather than local time
+        if modified_since.tzinfo is None:
+            return False
+
+        return self.mtime_ns // 1_000_000_000 <= modified_since.astimezone(UTC).timestamp()
+
+    def range_applies(self, request_headers: http.Headers) -> bool:
+        """
+        Whether a Range request should be honoured, given any If-Range header. If-Range must name the current
+        version of the file exactly, otherwise the whole file is sent.
+        """
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+
+        if_range = if_range.strip()
+        if if_range.startswith(('"', "W/")):
+            return if_range == self.etag
+        return if_range == self.last_modified
+
+
+class StaticFileCache:
+    """
+    Static files previously served, keyed by their path on disk. Cached files are revalidated against the file's
+    size and mtime with a single stat on each request, unless the cache is 'frozen', in which case cached files are
+    served with no filesystem access at all. Freezing is for production, where static files don't change while the
+    server is running.
+    """
+
+    def __init__(self, frozen: bool = False, max_file_size: int = 256 * 1024) -> None:
+        self.frozen = frozen
+        self.max_file_size = max_file_size
+        self._files: dict[Path, StaticFile] = {}
+        # Only used when frozen
+        self._precompressed: dict[Path, dict[str, StaticFile]] = {}
+
+    async def get(self, path: Path) -> StaticFile | None:
+        """The file at 'path', or None if it does not exist, or is not a regular file"""
+        static_file = self._files.get(path)
+        if static_file is not None and self.frozen:
+            return static_file
+
+        try:
+            file_stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            log.debug("path %s does not exist", path)
+            self._files.pop(path, None)
+            return None
+
+        if not stat.S_ISREG(file_stat.st_mode):
+            log.debug("path %s is not a file", path)
+            return None
+
+        if (
+            static_file is not None
+            and static_file.mtime_ns == file_stat.st_mtime_ns
+            and static_file.size == file_stat.st_size
+        ):
+            return static_file
+
+        content_type, content_encoding = mimetypes.guess_file_type(path)
+        # TODO: Check this
+        if content_type is None:
+            content_type = "application/octet-stream"
+
+        content = None
+        if file_stat.st_size <= self.max_file_size:
+            log.debug("caching contents of %s", path)
+            content = await asyncio.to_thread(path.read_bytes)
+
+        static_file = StaticFile(
+            path=path,
+            size=file_stat.st_size if content is None else len(content),
+            mtime_ns=file_stat.st_mtime_ns,
+            content_type=content_type,
+            content_encoding=content_encoding,
+            content=content,
+        )
+        self._files[path] = static_file
+        return static_file
+
+    async def get_precompressed(self, static_file: StaticFile) -> dict[str, StaticFile]:
+        """
+        The precompressed siblings of 'static_file', i.e. app.css.br and app.css.gz for app.css, by content encoding.
+        Siblings older than the file itself are ignored as stale.
+        """
+        if self.frozen:
+            cached = self._precompressed.get(static_file.path)
+            if cached is not None:
+                return cached
+
+        precompressed: dict[str, StaticFile] = {}
+        if static_file.content_encoding is None:
+            for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+                sibling = await self.get(static_file.path.with_name(static_file.path.name + extension))
+                if sibling is None or sibling.mtime_ns < static_file.mtime_ns:
+                    continue
+                precompressed[encoding] = sibling
+
+        if self.frozen:
+            self._precompressed[static_file.path] = precompressed
+        return precompressed
+
+    def clear(self) -> None:
+        self._files.clear()
+        self._precompressed.clear()
+
+
+# Requests for more ranges than this are served the whole file instead, rather than as many tiny parts
+MAX_RANGES = 16
+
+type ByteRange = tuple[int, int]
+
+
+def parse_range(range_header: str, size: int) -> list[ByteRange] | None:
+    """
+    Parse the value of a Range header into inclusive (start, end) byte ranges of a file of 'size' bytes. Returns None
+    when the header should be ignored, being malformed, not in bytes, or having too many ranges, and an empty list
+    when none of the ranges can be satisfied.
+    """
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or range_set == "":
+        return None
+
+    specs = range_set.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges: list[ByteRange] = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        if dash == "":
+            return None
+
+        if first == "":
+            # Suffix range, i.e. the last 'last' bytes
+            if not last.isdigit():
+                return None
+            if int(last) > 0 and size > 0:
+                ranges.append((max(size - int(last), 0), size - 1))
+            continue
+
+        if not first.isdigit() or (last != "" and not last.isdigit()):
+            return None
+
+        start = int(first)
+        end = size - 1 if last == "" else min(int(last), size - 1)
+        if last != "" and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    return ranges
+
+
+def _content_range(byte_range: ByteRange, size: int) -> bytes:
+    return f"bytes {byte_range[0]}-{byte_range[1]}/{size}".encode()
+
+
+async def send_file(
+    static_file: StaticFile,
+    request_headers: http.Headers,
+    send: asgi.ASGISendCallable,
+    extensions: Mapping[str, object] | None = None,
+    vary: bool = False,
+    immutable: bool = False,
+) -> None:
+    """
+    Send 'static_file', using any of the ASGI server's 'extensions' which make that cheaper. 'vary' marks the
+    response as depending on the request's Accept-Encoding, for files with precompressed siblings. 'immutable'
+    lets browsers cache fingerprinted files for a year.
+    """
+    if extensions is None:
+        extensions = {}
+    cache_headers = [(b"vary", b"accept-encoding")] if vary else []
+    if immutable:
+        cache_headers.append((b"cache-control", IMMUTABLE_CACHE_CONTROL))
+
+    if static_file.not_modified(request_headers):
+        log.debug("%s not modified", static_file.path)
+        not_modified_response: asgi.HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": HTTPStatus.NOT_MODIFIED,
+            "headers": [
+                (b"etag", static_file.etag.encode()),
+                (b"last-modified", static_file.last_modified.encode()),
+                *cache_headers,
+            ],
+        }
+        await send(not_modified_response)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return
+
+    headers = [
+        (b"etag", static_file.etag.encode()),
+        (b"last-modified", static_file.last_modified.encode()),
+        (b"accept-ranges", b"bytes"),
+        *cache_headers,
+    ]
+
+    if static_file.content_encoding is not None:
+        headers.append((b"content-encoding", static_file.content_encoding.encode()))
+
+    # The file is opened at most once, and stays open until the whole response has been sent
+    async with _ResponseFile(static_file.path) as response_file:
+        range_header = request_headers.get("range")
+        if range_header is not None and static_file.range_applies(request_headers):
+            ranges = parse_range(range_header, static_file.size)
+            if ranges is not None:
+                log.debug("serving ranges %s of %s", ranges, static_file.path)
+                return await _send_ranges(static_file, ranges, headers, send, extensions, response_file)
+
+        headers.append((b"content-type", static_file.content_type.encode()))
+        headers.append((b"content-length", str(static_file.size).encode()))
+
+        log.debug("headers %s", headers)
+        start_response: asgi.HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": HTTPStatus.OK,
+            "headers": headers,
+        }
+        await send(start_response)
+        await _send_window(static_file, 0, static_file.size - 1, send, False, extensions, response_file)
+
+
+async def _send_ranges(
+    static_file: StaticFile,
+    ranges: list[ByteRange],
+    headers: list[tuple[bytes, bytes]],
+    send: asgi.ASGISendCallable,
+    extensions: Mapping[str, object],
+    response_file: "_ResponseFile",
+) -> None:
+    if not ranges:
+        headers.append((b"content-range", f"bytes */{static_file.size}".encode()))
+        start_response: asgi.HTTPResponseStartEvent = {
+            "type": "http.response.start",
+            "status": HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+            "headers": headers,
+        }
+        await send(start_response)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers.append((b"content-type", static_file.content_type.encode()))
+        headers.append((b"content-range", _content_range(ranges[0], static_file.size)))
+        headers.append((b"content-length", str(end - start + 1).encode()))
+        start_response = {
+            "type": "http.response.start",
+            "status": HTTPStatus.PARTIAL_CONTENT,
+            "headers": headers,
+        }
+        await send(start_response)
+        await _send_window(static_file, start, end, send, False, extensions, response_file)
+        return
+
+    # Multiple ranges are sent as a multipart/byteranges body, with each range as its own part
+    boundary = secrets.token_hex(16)
+    part_headers = [
+        (
+            f"--{boundary}\r\ncontent-type: {static_file.content_type}\r\n".encode()
+            + b"content-range: "
+            + _content_range(byte_range, static_file.size)
+            + b"\r\n\r\n"
+        )
+        for byte_range in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    content_length = len(closing) + sum(
+        len(part_header) + (end - start + 1) + len(b"\r\n")
+        for part_header, (start, end) in zip(part_headers, ranges)
+    )
+
+    headers.append((b"content-type", f"multipart/byteranges; boundary={boundary}".encode()))
+    headers.append((b"content-length", str(content_length).encode()))
+    start_response = {
+        "type": "http.response.start",
+        "status": HTTPStatus.PARTIAL_CONTENT,
+        "headers": headers,
+    }
+    await send(start_response)
+
+    for part_header, (start, end) in zip(part_headers, ranges):
+        await send({"type": "http.response.body", "body": part_header, "more_body": True})
+        await _send_window(static_file, start, end, send, True, extensions, response_file)
+        await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+    await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+@final
+class _ResponseFile:
+    """
+    The file behind a response, opened on first use and shared by every window sent from it. Closed once the
+    response is complete, as servers using zerocopy may still be reading it after send returns.
+    """
+
+    __slots__ = ("_file", "path")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: BinaryIO | None = None
+
+    async def open(self) -> BinaryIO:
+        if self._file is None:
+            self._file = await asyncio.to_thread(open, self.path, "rb")
+        return self._file
+
+    async def read(self, offset: int, size: int) -> bytes:
+        """Read 'size' bytes from 'offset' in a worker thread, so a cold read doesn't block the event loop"""
+        return await asyncio.to_thread(_read_at, await self.open(), offset, size)
+
+    async def __aenter__(self) -> "_ResponseFile":
+        return self
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+
+
+def _read_at(f: BinaryIO, offset: int, size: int) -> bytes:
+    _ = f.seek(offset)
+    return f.read(size)
+
+
+async def _send_window(
+    static_file: StaticFile,
+    start: int,
+    end: int,
+    send: asgi.ASGISendCallable,
+    more_body: bool,
+    extensions: Mapping[str, object],
+    response_file: _ResponseFile,
+) -> None:
+    """
+    Send the bytes from 'start' to 'end' inclusive of 'static_file', reading only that window of the file. Files
+    not held in memory are handed to the server to send itself where it supports the ASGI pathsend or zerocopy
+    extensions, and are otherwise read a chunk at a time in a worker thread, so only one chunk is held in memory.
+    Files are opened through 'response_file', once per response.
+    """
+    whole_file = start == 0 and end == static_file.size - 1
+    if static_file.content is not None:
+        body = static_file.content
+        if not whole_file:
+            body = memoryview(static_file.content)[start : end + 1]
+
+        response_body: asgi.HTTPResponseBodyEvent = {
+            "type": "http.response.body",
+            "body": body,  # pyright: ignore[reportAssignmentType]
+            "more_body": more_body,
+        }
+        await send(response_body)
+        return
+
+    if end < start:
+        if not more_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return
+
+    if whole_file and not more_body and "http.response.pathsend" in extensions:
+        log.debug("sending %s with pathsend", static_file.path)
+        await send({"type": "http.response.pathsend", "path": str(static_file.path.resolve())})
+        return
+
+    if "http.response.zerocopy" in extensions:
+        log.debug("sending %s with zerocopy", static_file.path)
+        zerocopy_body: asgi.HTTPResponseZeroCopyEvent = {
+            "type": "http.response.zerocopy",
+            "file": await response_file.open(),
+            "offset": start,
+            "count": end - start + 1,
+            "more_body": more_body,
+        }
+        await send(zerocopy_body)
+        return
+
+    log.debug("sending %s in chunks", static_file.path)
+    # Each chunk is a new bytes object, as the server may keep a reference to a body after send returns
+    for offset in range(start, end + 1, CHUNK_SIZE):
+        response_body = {
+            "type": "http.response.body",
+            "body": await response_file.read(offset, min(CHUNK_SIZE, end + 1 - offset)),
+            "more_body": True,
+        }
+        await send(response_body)
+
+    if not more_body:
+        final_response_body: asgi.HTTPResponseBodyEvent = {
+            "type": "http.response.body",
+            "body": b"",
+            "more_body": False,
+        }
+        await send(final_response_body)
+
+
+def compress_directory(directory: Path, min_size: int = 256) -> list[Path]:
+    """
+    Write precompressed .gz siblings, and .br siblings if brotli is installed, for every compressible file in
+    'directory' of at least 'min_size' bytes. Siblings already newer than their file are left alone, as are
+    siblings which would be no smaller than the file. Returns the paths written.
+    """
+    written: list[Path] = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix in PRECOMPRESSED_EXTENSIONS.values():
+            continue
+
+        content_type, content_encoding = mimetypes.guess_file_type(path)
+        if content_type is None or content_encoding is not None or not encoders.is_compressible(content_type):
+            continue
+
+        file_stat = path.stat()
+        if file_stat.st_size < min_size:
+            continue
+
+        data: bytes | None = None
+        for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+            sibling = path.with_name(path.name + extension)
+            if sibling.exists() and sibling.stat().st_mtime_ns >= file_stat.st_mtime_ns:
+                continue
+
+            if data is None:
+                data = path.read_bytes()
+
+            if encoding not in encoders.ENCODINGS:
+                continue
+            compressed = encoders.compress(data, encoding, maximum=True)
+
+            if len(compressed) >= len(data):
+                log.debug("%s does not compress with %s, skipping", path, encoding)
+                continue
+
+            _ = sibling.write_bytes(compressed)
+            log.info("wrote %s (%d -> %d bytes)", sibling, len(data), len(compressed))
+            written.append(sibling)
+
+    return written
+
+
+class StaticManifest:
+    """
+    The manifest written by collect_static, mapping the names of static files, relative to the static directory, to
+    the names of their fingerprinted copies. Unless 'frozen', the manifest is reloaded when it changes on disk,
+    checking at most every 'check_interval' seconds. Without a manifest, or with one that can't be read, every file
+    keeps its own name.
+    """
+
+    def __init__(self, directory: Path, frozen: bool = False, check_interval: float = MANIFEST_CHECK_INTERVAL) -> None:
+        self.path = directory / MANIFEST_NAME
+        self.frozen = frozen
+        self.check_interval = check_interval
+        self._mtime_ns: int | None = None
+        self._checked = 0.0
+        self._names: dict[str, str] = {}
+        self._fingerprinted: frozenset[str] = frozenset()
+        self._loaded = False
+
+    def get(self, name: str) -> str:
+        """The fingerprinted name of the file 'name', or 'name' itself if it has not been collected"""
+        self._load()
+        return self._names.get(name, name)
+
+    def is_fingerprinted(self, name: str) -> bool:
+        """Whether 'name' is the name of a fingerprinted copy, so can be cached forever"""
+        self._load()
+        return name in self._fingerprinted
+
+    def _load(self) -> None:
+        if self._loaded and self.frozen:
+            return
+
+        now = time.monotonic()
+        if self._loaded and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if self._loaded and mtime_ns == self._mtime_ns:
+            return
+
+        names: dict[str, str] = {}
+        if mtime_ns is not None:
+            log.debug("loading static manifest %s", self.path)
+            try:
+                with open(self.path, "rb") as f:
+                    names = json.load(f)
+                if not isinstance(names, dict) or not all(
+                    isinstance(name, str) and isinstance(fingerprinted, str)
+                    for name, fingerprinted in names.items()
+                ):
+                    raise ValueError("expected an object mapping names to fingerprinted names")
+            except (OSError, ValueError) as e:
+                # Logged once per change to the file, as it isn't read again until it changes
+                log.warning("ignoring unreadable static manifest %s: %s", self.path, e)
+                names = {}
+
+        self._mtime_ns = mtime_ns
+        self._names = names
+        self._fingerprinted = frozenset(names.values())
+        self._loaded = True
+
+
+_manifests: dict[Path, StaticManifest] = {}
+
+
+def get_manifest(directory: Path, frozen: bool = False) -> StaticManifest:
+    """The manifest of the static 'directory', shared by everything serving or linking to its files"""
+    manifest = _manifests.get(directory)
+    if manifest is None:
+        manifest = _manifests[directory] = StaticManifest(directory, frozen)
+    return manifest
+
+
+_fingerprint_suffix = re.compile(r"\.[0-9a-f]{12}$")
+
+
+def fingerprint(path: Path, data: bytes) -> Path:
+    """The path of the fingerprinted copy of 'path', i.e. css/app.3f2a9c1e07b4.css for css/app.css"""
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}")
+
+
+def collect_static(directory: Path) -> dict[str, str]:
+    """
+    Write a fingerprinted copy of every file in 'directory', named after a hash of its contents, and a manifest
+    mapping each file's name to its copy's. Copies from earlier runs are kept, so pages already rendered with their
+    names keep working. Precompressed siblings are skipped, run compress_directory afterwards to compress the copies.
+    Returns the manifest.
+    """
+    manifest_path = directory / MANIFEST_NAME
+    names: dict[str, str] = {}
+    for path in sorted(directory.rglob("*")):
+        name = path.relative_to(directory).as_posix()
+        if (
+            not path.is_file()
+            or path == manifest_path
+            or path.suffix in PRECOMPRESSED_EXTENSIONS.values()
+            or _fingerprint_suffix.search(path.stem) is not None
+        ):
+            continue
+
+        fingerprinted_path = fingerprint(path, path.read_bytes())
+        if not fingerprinted_path.exists():
+            _ = shutil.copy2(path, fingerprinted_path)
+            log.info("wrote %s", fingerprinted_path)
+        names[name] = fingerprinted_path.relative_to(directory).as_posix()
+
+    _ = manifest_path.write_text(json.dumps(names, indent=2, sort_keys=True) + "\n")
+    return names
@@ -0,0 +1,364 @@
+import asyncio
+import gzip
+import logging
+import os
+from http import HTTPStatus
+from pathlib import Path
+from typing import BinaryIO
+
+import pytest
+
+from volt import asgi, components, config, http, static
+
+
+def test_static_file_cache(tmp_path: Path):
+    cache = static.StaticFileCache(max_file_size=16)
+    styles = tmp_path / "styles.css"
+    _ = styles.write_bytes(b"a { color: red }")
+
+    static_file = asyncio.run(cache.get(styles))
+    assert static_file is not None
+    assert static_file.content == b"a { color: red }"
+    assert static_file.size == 16
+    assert static_file.content_type == "text/css"
+
+    # Unchanged files are served from the cache
+    assert asyncio.run(cache.get(styles)) is static_file
+
+    # Changed files are reread
+    _ = styles.write_bytes(b"a { color: blue }")
+    static_file = asyncio.run(cache.get(styles))
+    assert static_file is not None
+    assert static_file.size == 17
+    # Now too large to hold in memory
+    assert static_file.content is None
+
+    assert asyncio.run(cache.get(tmp_path / "missing.css")) is None
+    assert asyncio.run(cache.get(tmp_path)) is None
+
+    styles.unlink()
+    assert asyncio.run(cache.get(styles)) is None
+
+
+def test_frozen_static_file_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = static.StaticFileCache(frozen=True)
+    script = tmp_path / "app.js"
+    _ = script.write_bytes(b"console.log('hi')")
+
+    static_file = asyncio.run(cache.get(script))
+    assert static_file is not None
+    assert static_file.content_type == "text/javascript"
+
+    # Frozen caches don't go back to the filesystem for files they have already served
+    def no_stat(*args: object, **kwargs: object) -> os.stat_result:
+        raise AssertionError("stat called")
+
+    monkeypatch.setattr(os, "stat", no_stat)
+    assert asyncio.run(cache.get(script)) is static_file
+
+
+def test_not_modified(tmp_path: Path):
+    path = tmp_path / "style.css"
+    _ = path.write_text("body {}")
+    os.utime(path, (0, 1_700_000_000))
+    static_file = asyncio.run(static.StaticFileCache().get(path))
+    assert static_file is not None
+
+    def not_modified(if_modified_since: str) -> bool:
+        return static_file.not_modified(http.Headers([http.Header("If-Modified-Since", if_modified_since)]))
+
+    assert not_modified(static_file.last_modified)
+    # Offsets are normalised to UTC before comparing
+    assert not_modified("Tue, 14 Nov 2023 22:13:20 +0100") is False
+    assert not_modified("Tue, 14 Nov 2023 22:13:20 -0100")
+    # Dates without a timezone, and ones that don't parse, are ignored
+    assert not_modified("Tue, 14 Nov 2023 23:13:20 -0000") is False
+    assert not_modified("yesterday") is False
+
+
+def test_parse_range():
+    assert static.parse_range("bytes=0-9", 100) == [(0, 9)]
+    assert static.parse_range("bytes=90-", 100) == [(90, 99)]
+    assert static.parse_range("bytes=-10", 100) == [(90, 99)]
+    assert static.parse_range("bytes=-200", 100) == [(0, 99)]
+    assert static.parse_range("bytes=95-200", 100) == [(95, 99)]
+    assert static.parse_range("bytes=0-0, 10-19", 100) == [(0, 0), (10, 19)]
+
+    # Unsatisfiable
+    assert static.parse_range("bytes=100-", 100) == []
+    assert static.parse_range("bytes=-0", 100) == []
+
+    # Ignored
+    assert static.parse_range("items=0-9", 100) is None
+    assert static.parse_range("bytes=9-0", 100) is None
+    assert static.parse_range("bytes=a-b", 100) is None
+    assert static.parse_range("bytes=", 100) is None
+    assert static.parse_range(",".join(["bytes=0-0"] + ["1-1"] * static.MAX_RANGES), 100) is None
+
+
+def send_file(
+    static_file: static.StaticFile,
+    headers: list[tuple[bytes, bytes]],
+    extensions: dict[str, object] | None = None,
+    vary: bool = False,
+    immutable: bool = False,
+) -> tuple[int, dict[bytes, bytes], bytes]:
+    """Send 'static_file', returning the status, headers and body sent"""
+    events: list[asgi.ASGISendEvent] = []
+
+    async def send(event: asgi.ASGISendEvent) -> None:
+        # Read files handed over for zero copy sending, as the server would
+        if event["type"] == "http.response.zerocopy":
+            _ = event["file"].seek(event.get("offset", 0))
+            event = {
+                "type": "http.response.body",
+                "body": event["file"].read(event.get("count", -1)),
+                "more_body": event.get("more_body", False),
+            }
+        elif event["type"] == "http.response.pathsend":
+            event = {"type": "http.response.body", "body": Path(event["path"]).read_bytes()}
+        events.append(event)
+
+    asyncio.run(static.send_file(static_file, http.Headers.from_raw(headers), send, extensions, vary, immutable))
+
+    start = events[0]
+    assert start["type"] == "http.response.start"
+    body = b"".join(bytes(event["body"]) for event in events[1:] if event["type"] == "http.response.body")
+    return start["status"], dict(start.get("headers", [])), body
+
+
+@pytest.mark.parametrize(
+    "max_file_size,extensions",
+    [
+        (1024, {}),
+        (0, {}),
+        (0, {"http.response.zerocopy": {}}),
+        (0, {"http.response.pathsend": {}}),
+    ],
+)
+def test_send_file_ranges(tmp_path: Path, max_file_size: int, extensions: dict[str, object]):
+    """
+    Ranges are served the same whether the file's contents are cached, memory mapped, or sent by the server with
+    the zerocopy or pathsend extensions
+    """
+    cache = static.StaticFileCache(max_file_size=max_file_size)
+    data = tmp_path / "data.txt"
+    _ = data.write_bytes(bytes(range(ord("a"), ord("z") + 1)) * 4)
+    static_file = asyncio.run(cache.get(data))
+    assert static_file is not None
+
+    status, headers, body = send_file(static_file, [], extensions)
+    assert status == HTTPStatus.OK
+    assert headers[b"accept-ranges"] == b"bytes"
+    assert body == data.read_bytes()
+
+    status, headers, body = send_file(static_file, [(b"range", b"bytes=2-5")], extensions)
+    assert status == HTTPStatus.PARTIAL_CONTENT
+    assert headers[b"content-range"] == b"bytes 2-5/104"
+    assert headers[b"content-length"] == b"4"
+    assert body == b"cdef"
+
+    status, headers, body = send_file(static_file, [(b"range", b"bytes=0-1,-2")], extensions)
+    assert status == HTTPStatus.PARTIAL_CONTENT
+    content_type = headers[b"content-type"].decode()
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.removeprefix("multipart/byteranges; boundary=")
+    assert int(headers[b"content-length"]) == len(body)
+    assert body == (
+        f"--{boundary}\r\ncontent-type: text/plain\r\ncontent-range: bytes 0-1/104\r\n\r\nab\r\n"
+        f"--{boundary}\r\ncontent-type: text/plain\r\ncontent-range: bytes 102-103/104\r\n\r\nyz\r\n"
+        f"--{boundary}--\r\n"
+    ).encode()
+
+    status, headers, body = send_file(static_file, [(b"range", b"bytes=200-")], extensions)
+    assert status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+    assert headers[b"content-range"] == b"bytes */104"
+    assert body == b""
+
+    # If-Range must match the current version of the file, or the whole file is sent
+    if_range = static_file.etag.encode()
+    status, _, body = send_file(static_file, [(b"range", b"bytes=2-5"), (b"if-range", if_range)], extensions)
+    assert status == HTTPStatus.PARTIAL_CONTENT
+    assert body == b"cdef"
+
+    status, _, body = send_file(static_file, [(b"range", b"bytes=2-5"), (b"if-range", b'"stale"')], extensions)
+    assert status == HTTPStatus.OK
+    assert len(body) == 104
+
+
+def test_send_file_extensions(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = static.StaticFileCache(max_file_size=0)
+    data = tmp_path / "data.bin"
+    _ = data.write_bytes(b"0123456789")
+    static_file = asyncio.run(cache.get(data))
+    assert static_file is not None
+
+    events: list[asgi.ASGISendEvent] = []
+
+    async def send(event: asgi.ASGISendEvent) -> None:
+        events.append(event)
+
+    asyncio.run(static.send_file(static_file, http.Headers(), send, {"http.response.pathsend": {}}))
+    assert events[1] == {"type": "http.response.pathsend", "path": str(data.resolve())}
+
+    events.clear()
+    range_headers = http.Headers.from_raw([(b"range", b"bytes=2-5")])
+    asyncio.run(static.send_file(static_file, range_headers, send, {"http.response.zerocopy": {}}))
+    assert events[1]["type"] == "http.response.zerocopy"
+    assert events[1].get("offset") == 2
+    assert events[1].get("count") == 4
+    assert len(events) == 2
+
+    # Files handed over for zerocopy stay open until the whole response has been sent
+    events.clear()
+    files: list[BinaryIO] = []
+
+    async def send_zerocopy(event: asgi.ASGISendEvent) -> None:
+        assert not any(f.closed for f in files)
+        if event["type"] == "http.response.zerocopy":
+            files.append(event["file"])
+        events.append(event)
+
+    range_headers = http.Headers.from_raw([(b"range", b"bytes=0-1, 4-5")])
+    asyncio.run(static.send_file(static_file, range_headers, send_zerocopy, {"http.response.zerocopy": {}}))
+    # Both ranges are sent from the one file, opened once for the response
+    assert len(files) == 2
+    assert files[0] is files[1]
+    assert files[0].closed
+    assert events[-1].get("more_body") is False
+
+    # Without either extension, chunks are read in a worker thread, again from a single open of the file
+    events.clear()
+    opened: list[Path] = []
+
+    def record_open(path: Path, mode: str) -> BinaryIO:
+        assert mode == "rb"
+        opened.append(path)
+        return open(path, "rb")
+
+    monkeypatch.setattr(static, "open", record_open, raising=False)
+    asyncio.run(static.send_file(static_file, range_headers, send))
+    assert opened == [data]
+    body = b"".join(event.get("body", b"") for event in events[1:] if event["type"] == "http.response.body")
+    assert b"\r\n\r\n01\r\n" in body
+    assert b"\r\n\r\n45\r\n" in body
+
+
+def test_precompressed(tmp_path: Path):
+    styles = tmp_path / "styles.css"
+    _ = styles.write_text("a { color: red }\n" * 100)
+    image = tmp_path / "image.png"
+    _ = image.write_bytes(b"\x89PNG" * 100)
+    small = tmp_path / "small.css"
+    _ = small.write_text("a {}")
+
+    written = static.compress_directory(tmp_path)
+    gzipped = tmp_path / "styles.css.gz"
+    assert gzipped in written
+    assert all(path.name.startswith("styles.css.") for path in written)
+    assert gzip.decompress(gzipped.read_bytes()) == styles.read_bytes()
+
+    # Up to date siblings are not rewritten
+    assert static.compress_directory(tmp_path) == []
+
+    cache = static.StaticFileCache()
+    static_file = asyncio.run(cache.get(styles))
+    assert static_file is not None
+    precompressed = asyncio.run(cache.get_precompressed(static_file))
+    assert precompressed["gzip"].path == gzipped
+    assert precompressed["gzip"].content_type == "text/css"
+    assert precompressed["gzip"].content_encoding == "gzip"
+
+    status, headers, body = send_file(precompressed["gzip"], [], vary=True)
+    assert status == HTTPStatus.OK
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"accept-encoding"
+    assert body == gzipped.read_bytes()
+
+    # Stale siblings are ignored
+    os.utime(gzipped, ns=(static_file.mtime_ns - 1, static_file.mtime_ns - 1))
+    assert "gzip" not in asyncio.run(cache.get_precompressed(static_file))
+
+
+def test_negotiate_encoding():
+    assert http.negotiate_encoding(None, ["br", "gzip"]) is None
+    assert http.negotiate_encoding("gzip, deflate, br", ["br", "gzip"]) == "br"
+    assert http.negotiate_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+    assert http.negotiate_encoding("br;q=0.5, gzip;q=0.8", ["br", "gzip"]) == "gzip"
+    assert http.negotiate_encoding("br;q=0, *", ["br", "gzip"]) == "gzip"
+    assert http.negotiate_encoding("identity", ["br", "gzip"]) is None
+
+
+def test_collect_static(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    styles = tmp_path / "css" / "app.css"
+    styles.parent.mkdir()
+    _ = styles.write_text("a { color: red }")
+    _ = styles.with_name("app.css.gz").write_bytes(gzip.compress(styles.read_bytes()))
+
+    manifest = static.collect_static(tmp_path)
+    assert list(manifest) == ["css/app.css"]
+    fingerprinted = tmp_path / manifest["css/app.css"]
+    assert fingerprinted.parent == styles.parent
+    assert fingerprinted.read_bytes() == styles.read_bytes()
+
+    # Fingerprinted copies aren't fingerprinted again
+    assert static.collect_static(tmp_path) == manifest
+
+    static_manifest = static.StaticManifest(tmp_path, check_interval=0)
+    assert static_manifest.get("css/app.css") == manifest["css/app.css"]
+    assert static_manifest.get("missing.css") == "missing.css"
+    assert static_manifest.is_fingerprinted(manifest["css/app.css"])
+    assert not static_manifest.is_fingerprinted("css/app.css")
+
+    # Changed files get a new name, and the manifest is reloaded
+    _ = styles.write_text("a { color: blue }")
+    manifest = static.collect_static(tmp_path)
+    assert static_manifest.get("css/app.css") == manifest["css/app.css"]
+    assert tmp_path / manifest["css/app.css"] != fingerprinted
+    assert fingerprinted.exists()
+
+    monkeypatch.setattr(config, "static_location", str(tmp_path))
+    template = components.environment.from_string("{{ static('css/app.css') }} {{ static('missing.css') }}")
+    assert template.render() == f"/static/{manifest['css/app.css']} /static/missing.css"
+
+    monkeypatch.setattr(config, "static_url_path", "/assets")
+    assert template.render() == f"/assets/{manifest['css/app.css']} /assets/missing.css"
+
+
+def test_static_manifest_checks(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    manifest_path = tmp_path / static.MANIFEST_NAME
+    _ = manifest_path.write_text('{"app.css": "app.0123456789ab.css"}')
+
+    # Changes are only noticed once the check interval has passed
+    static_manifest = static.StaticManifest(tmp_path, check_interval=60)
+    assert static_manifest.get("app.css") == "app.0123456789ab.css"
+    _ = manifest_path.write_text('{"app.css": "app.ba9876543210.css"}')
+    assert static_manifest.get("app.css") == "app.0123456789ab.css"
+
+    # A malformed manifest is logged once, and every file keeps its own name
+    _ = manifest_path.write_text('{"app.css": ')
+    static_manifest = static.StaticManifest(tmp_path, check_interval=0)
+    assert static_manifest.get("app.css") == "app.css"
+    assert static_manifest.get("app.css") == "app.css"
+    assert not static_manifest.is_fingerprinted("app.0123456789ab.css")
+    assert len([record for record in caplog.records if record.levelno == logging.WARNING]) == 1
+
+    _ = manifest_path.write_text('["app.css"]')
+    assert static_manifest.get("app.css") == "app.css"
+
+
+def test_send_immutable(tmp_path: Path):
+    styles = tmp_path / "app.css"
+    _ = styles.write_text("a { color: red }")
+    static_file = asyncio.run(static.StaticFileCache().get(styles))
+    assert static_file is not None
+
+    _, headers, _ = send_file(static_file, [])
+    assert b"cache-control" not in headers
+
+    _, headers, _ = send_file(static_file, [], immutable=True)
+    assert headers[b"cache-control"] == static.IMMUTABLE_CACHE_CONTROL
+
+    status, headers, _ = send_file(static_file, [(b"if-none-match", static_file.etag.encode())], immutable=True)
+    assert status == HTTPStatus.NOT_MODIFIED
+    assert headers[b"cache-control"] == static.IMMUTABLE_CACHE_CONTROL
@@ -0,0 +1,39 @@
+"""Helpers shared by Volt's tests, for building requests without running a server"""
+
+from volt import asgi, http
+
+
+def make_scope(
+    path: str = "/",
+    query_string: bytes = b"",
+    headers: list[tuple[bytes, bytes]] | None = None,
+    method: str = "GET",
+) -> asgi.HTTPScope:
+    return {
+        "type": "http",
+        "asgi": {"spec_version": "2.4", "version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "root_path": "",
+        "headers": headers or [],
+        "client": None,
+        "server": None,
+    }
+
+
+def make_request(
+    path: str = "/",
+    query_string: bytes = b"",
+    headers: list[tuple[bytes, bytes]] | None = None,
+    method: str = "GET",
+) -> http.Request:
+    """A request for 'path' with an empty body"""
+
+    async def receive() -> asgi.ASGIReceiveEvent:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    return http.Request(make_scope(path, query_string, headers, method), receive, {})
@@ -168,3 +168,117 @@ def get(root: Node[T], route: str, method: HTTPMethod) -> MatchedRoute[T] | None
         return
 
     return MatchedRoute(current_node.handlers[method], route_params)
+
+
+@final
+class CompiledNode[T]:
+    """A trie node stripped down for matching. The route param child is held directly, rather than found by a scan"""
+
+    __slots__ = ("children", "handlers", "param_child", "param_name", "param_value_type")
+
+    def __init__(self) -> None:
+        self.children: dict[str, CompiledNode[T]] = {}
+        self.param_child: CompiledNode[T] | None = None
+        self.param_name = ""
+        self.param_value_type: ParamValueType | None = None
+        self.handlers: dict[HTTPMethod, T] = {}
+
+
+@final
+class CompiledRoutes[T]:
+    """
+    A flattened, read-only view of a route trie. Fully static routes are matched with a single dict lookup on the
+    whole path. Routes containing route params are grouped by their number of segments, with each group matched by
+    a trie of its own, where every segment is resolved by at most one dict lookup and one route param check.
+    """
+
+    def __init__(self) -> None:
+        self.static_routes: dict[str, dict[HTTPMethod, T]] = {}
+        self.dynamic_routes: dict[int, CompiledNode[T]] = {}
+
+    def get(self, route: str, method: HTTPMethod) -> MatchedRoute[T] | None:
+        if not route.startswith("/"):
+            route = "/" + route
+
+        static_handlers = self.static_routes.get(route)
+        if static_handlers is not None:
+            handler = static_handlers.get(method)
+            if handler is None:
+                return None
+            return MatchedRoute(handler, {})
+
+        segments = route[1:].split("/")
+        current_node = self.dynamic_routes.get(len(segments))
+        if current_node is None:
+            return None
+
+        route_params: RouteParams = {}
+        for segment in segments:
+            child = current_node.children.get(segment)
+            if child is not None:
+                current_node = child
+                continue
+
+            child = current_node.param_child
+            if child is None:
+                return None
+
+            if child.param_value_type is ParamValueType.INTEGER:
+                try:
+                    route_params[child.param_name] = int(segment)
+                except ValueError:
+                    raise RouteParamParseError(
+                        f"Unable to parse route param segment {segment} as integer, as per {{{child.param_name}:int}}"
+                    )
+            else:
+                route_params[child.param_name] = segment
+            current_node = child
+
+        handler = current_node.handlers.get(method)
+        if handler is None:
+            return None
+
+        return MatchedRoute(handler, route_params)
+
+
+def compile_routes[T](root: Node[T]) -> CompiledRoutes[T]:
+    """Flatten the trie at 'root' into a CompiledRoutes, for faster matching"""
+    compiled = CompiledRoutes[T]()
+
+    if root.handlers:
+        compiled.static_routes["/"] = dict(root.handlers)
+
+    # Depth first walk, carrying the segments (and their nodes) leading to each node
+    stack: list[tuple[Node[T], list[tuple[str, Node[T]]]]] = [(root, [])]
+    while stack:
+        node, path = stack.pop()
+        for segment, child in node.children.items():
+            child_path = [*path, (segment, child)]
+            stack.append((child, child_path))
+
+            if not child.is_end_of_route or not child.handlers:
+                continue
+
+            if all(path_node.route_param_name == "" for _, path_node in child_path):
+                route = "/" + "/".join(path_segment for path_segment, _ in child_path)
+                compiled.static_routes[route] = dict(child.handlers)
+                continue
+
+            current_node = compiled.dynamic_routes.setdefault(len(child_path), CompiledNode[T]())
+            for path_segment, path_node in child_path:
+                if path_node.route_param_name == "":
+                    current_node = current_node.children.setdefault(path_segment, CompiledNode[T]())
+                    continue
+
+                if current_node.param_child is None:
+                    current_node.param_child = CompiledNode[T]()
+                    current_node.param_child.param_name = path_node.route_param_name
+                    current_node.param_child.param_value_type = path_node.route_param_value_type
+                current_node = current_node.param_child
+
+            current_node.handlers.update(child.handlers)
+
+    log.debug(
+        "compiled %d static routes, %d dynamic route depths", len(compiled.static_routes), len(compiled.dynamic_routes)
+    )
+    return compiled
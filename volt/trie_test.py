@@ -1,6 +1,6 @@
 import logging
+from collections.abc import Callable
 from http import HTTPMethod
-from typing import Callable
 
 import pytest
 
@@ -106,3 +106,73 @@ def test_with_methods():
     matched_route = trie.get(root, "/foo/3", HTTPMethod.POST)
 
     assert matched_route is None
+
+
+def test_compiled_get():
+    root = trie.Node[TestHandler]()
+    trie.insert(root, "/", HTTPMethod.GET, dummy_handler)
+    trie.insert(root, "/foo/bar", HTTPMethod.GET, dummy_handler)
+    trie.insert(root, "/foo/bar/baz", HTTPMethod.POST, dummy_handler)
+    trie.insert(root, "/foo/{id:int}/baz", HTTPMethod.GET, dummy_handler)
+    trie.insert(root, "/users/{name:str}", HTTPMethod.GET, dummy_handler)
+    compiled = trie.compile_routes(root)
+
+    assert set(compiled.static_routes) == {"/", "/foo/bar", "/foo/bar/baz"}
+
+    matched_route = compiled.get("/", HTTPMethod.GET)
+    assert matched_route is not None
+    assert matched_route.handler == dummy_handler
+
+    assert compiled.get("/foo", HTTPMethod.GET) is None
+    assert compiled.get("/foo/bar/baz", HTTPMethod.GET) is None
+    assert compiled.get("/not/present", HTTPMethod.GET) is None
+
+    matched_route = compiled.get("/foo/bar/baz", HTTPMethod.POST)
+    assert matched_route is not None
+    assert matched_route.route_params == {}
+
+    matched_route = compiled.get("/foo/3/baz", HTTPMethod.GET)
+    assert matched_route is not None
+    assert matched_route.handler == dummy_handler
+    assert matched_route.route_params == {"id": 3}
+
+    matched_route = compiled.get("/users/dirty", HTTPMethod.GET)
+    assert matched_route is not None
+    assert matched_route.route_params == {"name": "dirty"}
+
+    assert compiled.get("/users/dirty", HTTPMethod.POST) is None
+    assert compiled.get("/users/dirty/extra", HTTPMethod.GET) is None
+
+    with pytest.raises(trie.RouteParamParseError):
+        _ = compiled.get("/foo/string/baz", HTTPMethod.GET)
+
+
+def test_compiled_routes_structure():
+    """Static routes are matched by a single dict lookup, without walking any trie"""
+    # Quieten the per-insert debug logging, which would otherwise dominate
+    level = log.level
+    log.setLevel(logging.WARNING)
+    try:
+        root = trie.Node[TestHandler]()
+        for i in range(5_000):
+            trie.insert(root, f"/static/{i}/page", HTTPMethod.GET, dummy_handler)
+            trie.insert(root, f"/section{i}/{{id:int}}/detail", HTTPMethod.GET, dummy_handler)
+        compiled = trie.compile_routes(root)
+    finally:
+        log.setLevel(level)
+
+    assert len(compiled.static_routes) == 5_000
+    # Every dynamic route has three segments, so they share a single trie
+    assert list(compiled.dynamic_routes) == [3]
+
+    dynamic_routes = compiled.dynamic_routes
+    compiled.dynamic_routes = {}
+    matched_route = compiled.get("/static/5/page", HTTPMethod.GET)
+    assert matched_route is not None
+    assert matched_route.handler is dummy_handler
+    assert compiled.get("/section5/42/detail", HTTPMethod.GET) is None
+
+    compiled.dynamic_routes = dynamic_routes
+    matched_route = compiled.get("/section5/42/detail", HTTPMethod.GET)
+    assert matched_route is not None
+    assert matched_route.route_params == {"id": 42}